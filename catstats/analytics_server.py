@@ -0,0 +1,200 @@
+# Local stand-in for the Alma Analytics reports API, serving synthetic data
+# (see catstats.synthetic_data), so data loads can be run and benchmarked
+# without the real service or an API key; see the run_analytics_server command.
+# Like the real API, each report is returned in pages of QueryResult XML:
+# the first request has the report path and filter, and gets a ResumptionToken,
+# used to request the rest of the pages until IsFinished is true.
+# Column names are only in the first page's schema.
+import json
+import logging
+import random
+import re
+import threading
+import uuid
+from datetime import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape, quoteattr
+from catstats.management.commands.refresh_analytics_data import get_months
+from catstats.synthetic_data import SyntheticData
+
+logger = logging.getLogger(__name__)
+
+REPORTS_API = "/almaws/v1/analytics/reports"
+
+# Report columns, after the Column0 Analytics always adds
+COLUMN_NAMES = [
+    "962 - Local Param 02",
+    "Language Code",
+    "MMS Id",
+    "Material Type",
+    "Place Code",
+    "Resource Type",
+]
+
+
+def get_filter_prefix(filter_xml):
+    # The YYYYMM or YYYY the report is filtered on, as in
+    # refresh_analytics_data.get_filter(), or "" for all data.
+    match = re.search(r"%\$\$c (\d{1,6})%", filter_xml or "")
+    return match.group(1) if match else ""
+
+
+def get_page_xml(rows, is_finished, token=None):
+    # One page of QueryResult XML, with the schema (column names)
+    # only on the first page, which is the only one with a token.
+    parts = ['<QueryResult xmlns="urn:schemas-microsoft-com:xml-analysis:rowset">']
+    if token:
+        parts.append(f"<ResumptionToken>{token}</ResumptionToken>")
+    parts.append(f"<IsFinished>{str(is_finished).lower()}</IsFinished>")
+    parts.append(
+        '<ResultXml><rowset xmlns="urn:schemas-microsoft-com:xml-analysis:rowset">'
+    )
+    if token:
+        parts.append(
+            '<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+            ' xmlns:saw-sql="urn:saw-sql">'
+            '<xsd:complexType name="Row"><xsd:sequence>'
+            '<xsd:element name="Column0" type="xsd:int" saw-sql:columnHeading="0"/>'
+        )
+        for number, name in enumerate(COLUMN_NAMES, 1):
+            parts.append(
+                f'<xsd:element name="Column{number}" type="xsd:string"'
+                f" saw-sql:columnHeading={quoteattr(name)}/>"
+            )
+        parts.append("</xsd:sequence></xsd:complexType></xsd:schema>")
+    for row in rows:
+        parts.append("<Row><Column0>0</Column0>")
+        for number, name in enumerate(COLUMN_NAMES, 1):
+            parts.append(f"<Column{number}>{escape(row[name])}</Column{number}>")
+        parts.append("</Row>")
+    parts.append("</rowset></ResultXml></QueryResult>")
+    return "".join(parts)
+
+
+def get_error_data(message):
+    # Same structure as errors from the real API
+    return {
+        "errorsExist": True,
+        "errorList": {"error": [{"errorCode": "INTERNAL", "errorMessage": message}]},
+    }
+
+
+class AnalyticsStandIn:
+    # Report data, and the state of reports being paged through,
+    # shared by the server's request threads.
+    def __init__(
+        self,
+        rows_per_month=5000,
+        max_fields=4,
+        seed=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+    ):
+        # latency, jitter: seconds added to every response, plus up to jitter more.
+        # error_rate: fraction of requests failing with HTTP error_status instead.
+        self.rows_per_month = rows_per_month
+        self.max_fields = max_fields
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # (Rows iterator, next row) of reports not yet finished,
+        # keyed on resumption token
+        self.reports = {}
+        self.months = get_months("200701", dt.now().strftime("%Y%m"))
+
+    def get_report_rows(self, prefix):
+        # Rows for every month matching the filter, generated month by month,
+        # so each month's rows are the same whether loaded alone or in a year.
+        for month in self.months:
+            if month.startswith(prefix):
+                data = SyntheticData(
+                    f"{self.seed}-{month}", self.max_fields, months=[month]
+                )
+                # Unique MMS Ids for each month's bibs
+                first_mmsid = 9900000000000000 + int(month) * 100000
+                yield from data.get_rows(self.rows_per_month, first_mmsid)
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def wait(self):
+        with self.lock:
+            delay = self.latency + self.random.random() * self.jitter
+        if delay > 0:
+            sleep(delay)
+
+    def get_page(self, parameters):
+        # Returns the HTTP status and JSON data for a reports API request.
+        limit = parameters.get("limit", "25")
+        if not (limit.isdigit() and 25 <= int(limit) <= 1000):
+            return 400, get_error_data(f"Invalid limit: {limit}")
+        limit = int(limit)
+        token = parameters.get("token")
+        if token:
+            # Taken out while the page is generated, outside the lock,
+            # so pages of different reports are generated concurrently.
+            with self.lock:
+                report = self.reports.pop(token, None)
+            if report is None:
+                return 400, get_error_data(f"Unknown or expired token: {token}")
+            rows, next_row = report
+            page_rows = [next_row, *islice(rows, limit - 1)]
+        elif parameters.get("path"):
+            token = uuid.uuid4().hex
+            rows = self.get_report_rows(get_filter_prefix(parameters.get("filter")))
+            page_rows = list(islice(rows, limit))
+        else:
+            return 400, get_error_data("Either path or token is required")
+
+        # Read ahead one row, to tell whether this is the last page.
+        next_row = next(rows, None)
+        is_finished = next_row is None
+        if not is_finished:
+            with self.lock:
+                self.reports[token] = (rows, next_row)
+        first_page = not parameters.get("token")
+        xml = get_page_xml(page_rows, is_finished, token if first_page else None)
+        return 200, {"anies": [xml]}
+
+
+class AnalyticsRequestHandler(BaseHTTPRequestHandler):
+    # The server's stand_in handles everything but HTTP itself.
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        url = urlparse(self.path)
+        stand_in.wait()
+        if url.path != REPORTS_API:
+            status, data = 404, get_error_data(f"Unknown API: {url.path}")
+        elif stand_in.should_fail():
+            status, data = stand_in.error_status, get_error_data("Injected error")
+        else:
+            parameters = {k: v[0] for k, v in parse_qs(url.query).items()}
+            status, data = stand_in.get_page(parameters)
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(host="127.0.0.1", port=8001, **options):
+    # Returns a server (not yet serving) for an AnalyticsStandIn with options;
+    # port 0 picks any free port, available as server.server_port.
+    server = ThreadingHTTPServer((host, port), AnalyticsRequestHandler)
+    server.daemon_threads = True
+    server.stand_in = AnalyticsStandIn(**options)
+    return server
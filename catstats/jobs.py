@@ -0,0 +1,172 @@
+# Queue of data loads requested from the web, stored in LoadJob and run
+# one at a time by the run_load_worker command, in its own process, so loads
+# don't use web server memory, or die when web server workers are recycled.
+# Any number of worker processes can run, but only one job runs at a time
+# across all of them: see claim_next_job().
+# Worker processes can still be killed or restarted at any time, taking
+# a running job with them, so running jobs record where they run, and
+# a heartbeat while they do.
+import logging
+import os
+import re
+import socket
+import threading
+from datetime import timedelta
+from time import sleep
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from catstats.models import LoadJob
+
+logger = logging.getLogger(__name__)
+
+# How often a running job's heartbeat is recorded
+HEARTBEAT_SECONDS = 60
+# Running jobs with no heartbeat for this long are assumed to have died
+# with their process, however long they've been running.
+HEARTBEAT_TIMEOUT = timedelta(seconds=5 * HEARTBEAT_SECONDS)
+
+# How often an idle worker checks for queued jobs
+POLL_SECONDS = 10
+
+
+def is_valid_yyyymm(yyyymm):
+    # Same values as refresh_analytics_data -m
+    return yyyymm in ["ALL", "INCREMENTAL"] or bool(
+        re.fullmatch(r"20\d\d(0[1-9]|1[0-2])", yyyymm)
+    )
+
+
+def enqueue_load(yyyymm):
+    # Returns the job for yyyymm, and whether it's new: if a load of the same
+    # data is already queued or running, that job is returned instead.
+    try:
+        with transaction.atomic():
+            return LoadJob.objects.create(yyyymm=yyyymm), True
+    except IntegrityError:
+        job = LoadJob.objects.filter(
+            yyyymm=yyyymm,
+            status__in=[LoadJob.Status.QUEUED, LoadJob.Status.RUNNING],
+        ).first()
+        if job is None:
+            # Finished in the meantime
+            return enqueue_load(yyyymm)
+        return job, False
+
+
+def is_abandoned(job):
+    # Whether a running job's process has stopped running it.
+    if (
+        job.heartbeat_at is None
+        or job.heartbeat_at < timezone.now() - HEARTBEAT_TIMEOUT
+    ):
+        return True
+    if job.hostname == socket.gethostname() and job.pid != os.getpid():
+        # Another process on this host, so it can be checked directly.
+        try:
+            os.kill(job.pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # Exists, but belongs to another user
+            pass
+    return False
+
+
+def claim_next_job():
+    # Mark the oldest queued job as running and return it, unless any job
+    # is already running (here or in another process), or nothing is queued.
+    with transaction.atomic():
+        # Locking all active jobs makes workers claim one at a time.
+        active_jobs = list(
+            LoadJob.objects.select_for_update()
+            .filter(status__in=[LoadJob.Status.QUEUED, LoadJob.Status.RUNNING])
+            .order_by("created_at", "id")
+        )
+        for job in active_jobs:
+            if job.status == LoadJob.Status.RUNNING:
+                if not is_abandoned(job):
+                    return None
+                logger.error(f"Load job {job.id} for {job.yyyymm} abandoned")
+                job.status = LoadJob.Status.FAILED
+                job.error = "Abandoned"
+                job.finished_at = timezone.now()
+                job.save()
+        queued_jobs = [j for j in active_jobs if j.status == LoadJob.Status.QUEUED]
+        if not queued_jobs:
+            return None
+        job = queued_jobs[0]
+        job.status = LoadJob.Status.RUNNING
+        job.started_at = timezone.now()
+        job.hostname = socket.gethostname()
+        job.pid = os.getpid()
+        job.heartbeat_at = job.started_at
+        job.save()
+        return job
+
+
+def send_heartbeats(job, stop):
+    # Record job's heartbeat every HEARTBEAT_SECONDS until stop is set,
+    # in its own thread, so it continues during long steps of a load
+    # (like rebuilding indexes) which report no progress.
+    try:
+        while not stop.wait(timeout=HEARTBEAT_SECONDS):
+            LoadJob.objects.filter(pk=job.pk, status=LoadJob.Status.RUNNING).update(
+                heartbeat_at=timezone.now()
+            )
+    except Exception:
+        logger.exception(f"ERROR: Heartbeat for load job {job.id} failed")
+    finally:
+        connections.close_all()
+
+
+def run_job(job):
+    logger.info(f"Starting load job {job.id} for {job.yyyymm}")
+    stop_heartbeats = threading.Event()
+    heartbeats = threading.Thread(
+        target=send_heartbeats,
+        args=(job, stop_heartbeats),
+        name=f"catstats-load-job-{job.id}-heartbeat",
+        daemon=True,
+    )
+    heartbeats.start()
+    try:
+        call_command("refresh_analytics_data", yyyymm=job.yyyymm, load_job=job.id)
+    except Exception as ex:
+        logger.error(f"ERROR: Load job {job.id} for {job.yyyymm} failed: {ex}")
+        job.status = LoadJob.Status.FAILED
+        job.error = str(ex)
+    else:
+        job.status = LoadJob.Status.DONE
+    finally:
+        stop_heartbeats.set()
+        heartbeats.join()
+    # Set by the command, if it got as far as starting its run
+    job.refresh_from_db(fields=["load_run"])
+    job.rows_loaded = job.load_run.rows_loaded if job.load_run else 0
+    job.finished_at = timezone.now()
+    job.save()
+    logger.info(
+        f"Finished load job {job.id} for {job.yyyymm}: {job.status}, "
+        f"{job.rows_loaded} rows in {job.duration:.1f} seconds"
+    )
+
+
+def run_queued_jobs():
+    # Run jobs until none are left (or another process is running one).
+    try:
+        while job := claim_next_job():
+            run_job(job)
+    except Exception:
+        logger.exception("ERROR: Load job worker failed")
+
+
+def run_worker(poll_seconds=POLL_SECONDS):
+    # Runs until the process is stopped, checking for queued jobs
+    # every poll_seconds.
+    logger.info(f"Load job worker {socket.gethostname()}:{os.getpid()} started")
+    while True:
+        run_queued_jobs()
+        # Don't hold a database connection while idle.
+        connections.close_all()
+        sleep(poll_seconds)
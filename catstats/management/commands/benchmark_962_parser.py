@@ -0,0 +1,83 @@
+import timeit
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from catstats.scripts.field_962 import parse_962_fields
+from catstats.synthetic_data import SyntheticData
+
+
+# The implementations parse_962_fields() replaced, for comparison.
+def parse_with_defaultdict(local_param_02):
+    # As in refresh_analytics_data.parse_row(): a dict of lists per field
+    fields = []
+    for fld_962 in local_param_02.split(";"):
+        r = fld_962.strip()
+        sfd_dict = defaultdict(list)
+        for subfield in r.split("$$")[1:]:
+            code, value = subfield.strip().split(" ", 1)
+            sfd_dict[code].append(value)
+        fields.append(sfd_dict)
+    return fields
+
+
+def parse_with_dict(local_param_02):
+    # As in get_catstats_data.expand_and_filter_data(): only the last value
+    # of repeated subfields is kept.
+    return [
+        {
+            code: value
+            for sfd in fld_962.split("$$")[1:]
+            for code, value in [sfd.strip().split(" ", 1)]
+        }
+        for fld_962 in local_param_02.split(";")
+    ]
+
+
+PARSERS = {
+    "parse_962_fields": parse_962_fields,
+    "defaultdict (old load)": parse_with_defaultdict,
+    "dict (old live path)": parse_with_dict,
+}
+
+
+class Command(BaseCommand):
+    help = "Time parsing 962 fields, compared with earlier implementations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-b", "--bibs", type=int, default=20000, help="Number of bibs to parse"
+        )
+        parser.add_argument(
+            "-r",
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of times to parse them all; the best time is shown",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed, for repeatable data"
+        )
+
+    def handle(self, *args, **options):
+        if options["bibs"] < 1 or options["repeat"] < 1:
+            raise CommandError("--bibs and --repeat must be at least 1")
+        values = [
+            row["962 - Local Param 02"]
+            for row in SyntheticData(options["seed"]).get_rows(options["bibs"])
+        ]
+        field_count = sum(len(parse_962_fields(value)) for value in values)
+        self.stdout.write(f"Parsing {len(values)} bibs, {field_count} 962 fields")
+        baseline = None
+        for name, parse in PARSERS.items():
+            seconds = min(
+                timeit.repeat(
+                    lambda: [parse(value) for value in values],
+                    number=1,
+                    repeat=options["repeat"],
+                )
+            )
+            baseline = baseline or seconds
+            self.stdout.write(
+                f"{name:24} {seconds * 1000:8.1f} ms "
+                f"{field_count / seconds:10.0f} fields/second "
+                f"{seconds / baseline:6.2f}x"
+            )
@@ -0,0 +1,189 @@
+import json
+import logging
+import statistics
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from catstats.forms import REPORT_PERIODS, REPORTS
+from catstats.management.commands.refresh_analytics_data import add_data_to_db
+from catstats.models import BibRecord, Field962
+from catstats.reports import REPORT_SPECS, can_use_rollups, get_report
+from catstats.synthetic_data import SyntheticData
+from catstats.view_utils import get_report_filters
+
+logger = logging.getLogger(__name__)
+
+# Optional filters to benchmark each report and period with, besides none.
+# Values are common in data from generate_catstats_data.
+FILTER_SETS = {
+    "none": {},
+    "cat_center": {"cat_center": "rams"},
+    "cataloger": {"cat_center": "rams", "cataloger": "cat000"},
+    "language": {"language_code": "eng"},
+    "project": {"f962_k_code": "proj1"},
+}
+# Bibs generated for the load benchmark start here, well away from the
+# MMS Ids of generate_catstats_data.
+LOAD_BENCHMARK_MMSID = 9800000000000000
+
+
+def time_report(filters, use_rollups, repeat):
+    # Returns the query count and wall times of repeat runs of the report.
+    times = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start_time = perf_counter()
+            get_report(filters, use_rollups=use_rollups)
+            times.append(perf_counter() - start_time)
+    return len(queries), times
+
+
+def time_load(bib_count):
+    # Load new synthetic bibs, then roll them back, leaving the data unchanged.
+    rows = list(SyntheticData(seed=1).get_rows(bib_count, LOAD_BENCHMARK_MMSID))
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as queries:
+            start_time = perf_counter()
+            add_data_to_db(rows)
+            seconds = perf_counter() - start_time
+        transaction.set_rollback(True)
+    return {
+        "bibs": bib_count,
+        "queries": len(queries),
+        "seconds": seconds,
+        "bibs_per_second": bib_count / seconds,
+    }
+
+
+def summarize(times):
+    return {"min_seconds": min(times), "median_seconds": statistics.median(times)}
+
+
+class Command(BaseCommand):
+    help = "Time every report, and loading data, writing results to a JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-m",
+            "--yyyymm",
+            type=str,
+            help="YYYYMM to run reports for (default: last month with data)",
+        )
+        parser.add_argument(
+            "-r",
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of times to run each report",
+        )
+        parser.add_argument(
+            "--load-bibs",
+            type=int,
+            default=5000,
+            help="Number of bibs to time loading, then roll back (0 to skip)",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            type=str,
+            default="logs/benchmark_results.json",
+            help="File to write results to",
+        )
+        parser.add_argument(
+            "--compare",
+            type=str,
+            help="Earlier results file to compare with",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        yyyymm = options["yyyymm"] or (
+            Field962.objects.filter(yyyymm__lte=timezone.now().strftime("%Y%m"))
+            .order_by("-yyyymm")
+            .values_list("yyyymm", flat=True)
+            .first()
+        )
+        if yyyymm is None:
+            raise CommandError("No data: load some with generate_catstats_data")
+
+        results = {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "bib_count": BibRecord.objects.count(),
+            "field_count": Field962.objects.count(),
+            "yyyymm": yyyymm,
+            "repeat": options["repeat"],
+            "reports": [],
+        }
+        for report, _ in REPORTS:
+            for report_period, _ in REPORT_PERIODS:
+                for filter_set, filter_values in FILTER_SETS.items():
+                    form_data = {
+                        "report": report,
+                        "cat_center": "ALL",
+                        "year": yyyymm[0:4],
+                        "month": yyyymm[4:6],
+                        "report_period": report_period,
+                        "cataloger": "",
+                        "language_code": "",
+                        "place_code": "",
+                        "f962_k_code": "",
+                    } | filter_values
+                    filters = get_report_filters(form_data)
+                    # Rollups, if the report can use them, and raw tables
+                    sources = [("raw", False)]
+                    if can_use_rollups(REPORT_SPECS[report], filters):
+                        sources.insert(0, ("rollups", True))
+                    for source, use_rollups in sources:
+                        query_count, times = time_report(
+                            filters, use_rollups, options["repeat"]
+                        )
+                        result = {
+                            "report": report,
+                            "period": report_period,
+                            "filters": filter_set,
+                            "source": source,
+                            "queries": query_count,
+                        } | summarize(times)
+                        results["reports"].append(result)
+                        self.stdout.write(
+                            f"Report {report} {report_period} {filter_set:10} "
+                            f"{source:7}: {result['median_seconds'] * 1000:8.1f} ms, "
+                            f"{query_count} queries"
+                        )
+        if options["load_bibs"] > 0:
+            results["load"] = time_load(options["load_bibs"])
+            self.stdout.write(
+                f"Loaded {options['load_bibs']} bibs: "
+                f"{results['load']['bibs_per_second']:.0f} bibs/second"
+            )
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+        if options["compare"]:
+            self.compare(results, options["compare"])
+
+    def compare(self, results, earlier_file):
+        # Show the median time of each report relative to the earlier results.
+        with open(earlier_file) as f:
+            earlier = json.load(f)
+        key_names = ["report", "period", "filters", "source"]
+        earlier_times = {
+            tuple(result[name] for name in key_names): result["median_seconds"]
+            for result in earlier["reports"]
+        }
+        self.stdout.write(f"Compared with {earlier_file} ({earlier['created_at']}):")
+        for result in results["reports"]:
+            key = tuple(result[name] for name in key_names)
+            if earlier_times.get(key):
+                ratio = result["median_seconds"] / earlier_times[key]
+                self.stdout.write(f"{' '.join(key):30} {ratio:6.2f}x")
+        if "load" in results and "load" in earlier:
+            ratio = (
+                results["load"]["bibs_per_second"] / earlier["load"]["bibs_per_second"]
+            )
+            self.stdout.write(f"{'load bibs/second':30} {ratio:6.2f}x")
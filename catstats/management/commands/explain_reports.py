@@ -0,0 +1,85 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from catstats.forms import REPORT_PERIODS, REPORTS
+from catstats.reports import get_report
+from catstats.view_utils import get_report_filters
+
+
+class Command(BaseCommand):
+    help = (
+        "Run reports against the raw tables, showing timings and database query "
+        "plans; compare output before and after schema changes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-r",
+            "--report",
+            action="append",
+            choices=[code for code, _ in REPORTS],
+            help="Report code to run (repeatable); default is all reports",
+        )
+        parser.add_argument(
+            "-m",
+            "--yyyymm",
+            type=str,
+            default=timezone.localdate().strftime("%Y%m"),
+            help="YYYYMM to report on; default is the current month",
+        )
+        parser.add_argument(
+            "-p",
+            "--period",
+            choices=[code for code, _ in REPORT_PERIODS],
+            default="fy",
+            help="Report period; default is fiscal year",
+        )
+        parser.add_argument(
+            "-c", "--cat-center", type=str, default="ALL", help="Default is ALL"
+        )
+        parser.add_argument("-k", "--f962-k-code", type=str, default="")
+        parser.add_argument(
+            "--rollups",
+            action="store_true",
+            help="Use rollup tables when they cover the report, as the application does",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run each query for actual row counts and timings (PostgreSQL only)",
+        )
+
+    def handle(self, *args, **options):
+        explain_options = {"analyze": True} if options["analyze"] else {}
+        explain_prefix = connection.ops.explain_query_prefix(**explain_options)
+        for report in options["report"] or [code for code, _ in REPORTS]:
+            filters = get_report_filters(
+                {
+                    "report": report,
+                    "cat_center": options["cat_center"],
+                    "year": options["yyyymm"][0:4],
+                    "month": options["yyyymm"][4:6],
+                    "report_period": options["period"],
+                    "cataloger": "",
+                    "language_code": "",
+                    "place_code": "",
+                    "f962_k_code": options["f962_k_code"],
+                }
+            )
+            with CaptureQueriesContext(connection) as context:
+                start_time = perf_counter()
+                _, display_data = get_report(filters, use_rollups=options["rollups"])
+                elapsed = perf_counter() - start_time
+            self.stdout.write(
+                f"Report {report}: {len(display_data)} rows, "
+                f"{len(context.captured_queries)} queries, {elapsed:.3f} seconds"
+            )
+            for query in context.captured_queries:
+                self.stdout.write(query["sql"])
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{explain_prefix} {query['sql']}")
+                    for row in cursor.fetchall():
+                        self.stdout.write("    " + " ".join(str(col) for col in row))
+            self.stdout.write("")
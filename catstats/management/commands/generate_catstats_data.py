@@ -0,0 +1,61 @@
+import logging
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from catstats.management.commands.refresh_analytics_data import (
+    CopyLoader,
+    add_data_to_db,
+)
+from catstats.reports import bump_data_version
+from catstats.rollups import rebuild_rollups
+from catstats.synthetic_data import SyntheticData
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Load synthetic catstats data, for development and benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-b", "--bibs", type=int, default=100000, help="Number of bibs to load"
+        )
+        parser.add_argument(
+            "--max-fields",
+            type=int,
+            default=4,
+            help="Largest number of 962 fields per bib (most have 1)",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed, for repeatable data"
+        )
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Replace all existing data, using PostgreSQL COPY",
+        )
+
+    def handle(self, *args, **options):
+        if options["bibs"] < 1 or options["max_fields"] < 1:
+            raise CommandError("--bibs and --max-fields must be at least 1")
+        if options["replace"] and connection.vendor != "postgresql":
+            raise CommandError("--replace requires PostgreSQL")
+        data = SyntheticData(options["seed"], options["max_fields"])
+        rows = data.get_rows(options["bibs"])
+        start_time = perf_counter()
+        if options["replace"]:
+            loader = CopyLoader()
+            try:
+                loader.start()
+                loader.load(rows)
+            finally:
+                loader.finish()
+        else:
+            # Same MMS Ids for the same seed, so bibs from earlier runs
+            # are replaced.
+            add_data_to_db(rows)
+        logger.info(
+            f"Loaded {options['bibs']} bibs in {perf_counter() - start_time:.1f} seconds"
+        )
+        rebuild_rollups()
+        bump_data_version()
@@ -1,36 +1,117 @@
-import json
+import argparse
+import hashlib
 import logging
 import os
 import pprint as pp
-import xmltodict
-from collections import defaultdict
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime as dt
-from django.core.management.base import BaseCommand
-from catstats.models import BibRecord, Field962, RepeatableSubfield
+from itertools import islice
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from catstats.models import (
+    BibRecord,
+    Field962,
+    LoadJob,
+    LoadRun,
+    LoadState,
+    RepeatableSubfield,
+)
+from catstats.partitions import ensure_partitions, truncate_tables
+from catstats.reports import bump_data_version, warm_report_cache
+from catstats.rollups import rebuild_rollups
 from catstats.scripts.alma_api_client import Alma_Api_Client
+from catstats.scripts.analytics_report import get_report_data
+from catstats.scripts.field_962 import REPEATABLE_SUBFIELDS, parse_962_fields
 
 logger = logging.getLogger(__name__)
 
+# Number of objects written per INSERT when loading data
+BULK_BATCH_SIZE = 1000
+# Number of Analytics rows (bibs) parsed and loaded per transaction
+LOAD_BATCH_SIZE = 5000
+# Seconds between progress updates (log messages and LoadRun saves)
+PROGRESS_INTERVAL = 10
 
-def get_real_column_names(report_json):
-    # Column names are buried in metadata
-    # Get dictionary of column info
-    # This seems to be available only on initial run (first set of data, not subsequent ones),
-    # even if col_names = true parameter is always passed to API.
-    column_names = {}
-    try:
-        column_info = report_json["ResultXml"]["rowset"]["xsd:schema"][
-            "xsd:complexType"
-        ]["xsd:sequence"]["xsd:element"]
-        # Create mapping of generic column names (Column0 etc.) to real column names
-        for row in column_info:
-            generic_name = row["@name"]
-            real_name = row["@saw-sql:columnHeading"]
-            column_names[generic_name] = real_name
-    except KeyError:
-        # OK to swallow this error
-        pass
-    return column_names
+
+class LoadProgress:
+    # Counts and timings for the current run, added to by the threads fetching
+    # pages and the one writing to the database, and saved in a LoadRun.
+    # Outside the command (as in tests), the LoadRun is never saved.
+    counters = [
+        "pages_fetched",
+        "rows_fetched",
+        "rows_loaded",
+        "http_seconds",
+        "xml_seconds",
+        "parse_seconds",
+        "db_seconds",
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.run = LoadRun()
+        self.last_update = perf_counter()
+        # Months whose data has changed, for rebuilding their rollups
+        self.changed_months = set()
+
+    def start(self, yyyymm):
+        self.run = LoadRun.objects.create(yyyymm=yyyymm)
+        self.last_update = perf_counter()
+        self.changed_months = set()
+
+    def add(self, **amounts):
+        with self.lock:
+            for counter, amount in amounts.items():
+                setattr(self.run, counter, getattr(self.run, counter) + amount)
+
+    @contextmanager
+    def timed(self, stage):
+        # Add the time spent in the with block to stage_seconds.
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(**{f"{stage}_seconds": perf_counter() - start_time})
+
+    def update(self, force=False):
+        # Log and save progress, if it's been a while.
+        # Called only from the thread writing to the database.
+        if not force and perf_counter() - self.last_update < PROGRESS_INTERVAL:
+            return
+        self.last_update = perf_counter()
+        with self.lock:
+            values = {counter: getattr(self.run, counter) for counter in self.counters}
+        logger.info(
+            "Progress: "
+            + ", ".join(
+                f"{counter}={round(value, 1)}" for counter, value in values.items()
+            )
+        )
+        if self.run.pk is not None:
+            LoadRun.objects.filter(pk=self.run.pk).update(**values)
+
+    def finish(self, error=None):
+        if error is None:
+            self.run.status = LoadRun.Status.DONE
+        else:
+            self.run.status = LoadRun.Status.FAILED
+            # Some, like KeyboardInterrupt, have no message.
+            self.run.error = str(error) or type(error).__name__
+        self.run.finished_at = timezone.now()
+        self.update(force=True)
+        if self.run.pk is not None:
+            self.run.save()
+
+
+# Progress of the current run
+progress = LoadProgress()
 
 
 def get_filter(yyyymm):
@@ -51,32 +132,24 @@ def get_filter(yyyymm):
     return filter_xml.replace("\n", "").replace("\t", "")
 
 
-def get_report_data(report):
-    # Report available only in XML
-    # Entire XML report is a "list" with one value, in 'anies' element of json response
-    xml = report["anies"][0]
-    # Convert xml to python dict intermediate format
-    xml_dict = xmltodict.parse(xml)
-    # Convert this to real json
-    report_json = json.loads(json.dumps(xml_dict))
-    # Everything is in QueryResult dict
-    report_json = report_json["QueryResult"]
-
-    # Actual rows of data are a list of dictionaries, in this dictionary
-    rows = report_json["ResultXml"]["rowset"]["Row"]
-
-    # Clean up
-    report_data = {
-        "rows": rows,
-        "column_names": get_real_column_names(report_json),
-        "is_finished": report_json["IsFinished"],  # should always exist
-        "resumption_token": report_json.get("ResumptionToken"),  # may not exist
-    }
-
+def fetch_report_page(alma, parameters):
+    with progress.timed("http"):
+        report = alma.get_analytics_report(parameters)
+    try:
+        with progress.timed("xml"):
+            report_data = get_report_data(report)
+    except Exception as ex:
+        pp.pprint(ex)
+        pp.pprint(report["api_response"])
+        raise
+    progress.add(pages_fetched=1, rows_fetched=len(report_data["rows"]))
     return report_data
 
 
 def run_report(filter):
+    # Generator yielding rows one page at a time, as soon as each page arrives,
+    # so callers never need to hold all rows at once.  While a page's rows
+    # are being consumed, the next page is fetched in the background.
     logger.info(f"Running with {filter = }....")
     api_key = os.getenv("ALMA_API_KEY")
     alma = Alma_Api_Client(api_key)
@@ -96,124 +169,531 @@ def run_report(filter):
         "path": report_path,
         "filter": filter_xml,
     }
-    # First run: use constant + initial parameters merged
-    batch_number = 1
-    logger.info(f"Fetching batch #{batch_number}")
-    report = alma.get_analytics_report(constant_params | initial_params)
-    report_data = get_report_data(report)
-    all_rows = report_data["rows"]
-    # Preserve column_names as they don't seem to be set on subsequent runs
-    column_names = report_data["column_names"]
-
-    # Use the token from first run in all subsequent ones
-    subsequent_params = {
-        "token": report_data["resumption_token"],
-    }
-
-    while report_data["is_finished"] == "false":
-        batch_number += 1
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        # First run: use constant + initial parameters merged
+        batch_number = 1
         logger.info(f"Fetching batch #{batch_number}")
-        # After first run: use constant = subsequent parameters merged
-        try:
-            report = alma.get_analytics_report(constant_params | subsequent_params)
-            report_data = get_report_data(report)
-            all_rows.extend(report_data["rows"])
-        except Exception as ex:
-            pp.pprint(ex)
-            pp.pprint(report["api_response"])
-            raise
+        report_data = fetch_report_page(alma, constant_params | initial_params)
+        # Preserve column_names as they don't seem to be set on subsequent runs
+        column_names = report_data["column_names"]
 
-    # Replace 'Column0' etc. names with real names, discarding unwanted Column0
-    data = []
-    for row in all_rows:
-        # Update keys to use real column names, removing meaningless Column0
-        row = dict([(column_names.get(k), v) for k, v in row.items() if k != "Column0"])
-        data.append(row)
+        # Use the token from first run in all subsequent ones
+        subsequent_params = {
+            "token": report_data["resumption_token"],
+        }
 
-    return data
+        while True:
+            next_page = None
+            if report_data["is_finished"] == "false":
+                batch_number += 1
+                logger.info(f"Fetching batch #{batch_number}")
+                # After first run: use constant = subsequent parameters merged
+                next_page = prefetcher.submit(
+                    fetch_report_page, alma, constant_params | subsequent_params
+                )
 
+            # Replace 'Column0' etc. names with real names, discarding unwanted Column0
+            for row in report_data["rows"]:
+                yield {column_names.get(k): v for k, v in row.items() if k != "Column0"}
 
-def add_data_to_db(report_data):
-    logger.info(f"{len(report_data) = }")
-    replaced_bibs = 0
+            if next_page is None:
+                break
+            report_data = next_page.result()
+
+
+def iter_batches(iterable, batch_size):
+    # Yield lists of up to batch_size items from any iterable.
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def parse_row(row):
+    # Each row is one bib, with 1+ 962 fields embeded in 'Local Param 02'.
+    # Returns an unsaved BibRecord, plus a list of (Field962, [RepeatableSubfield])
+    # tuples linked to it, ready for bulk_create().
+    bib = BibRecord(
+        mmsid=row["MMS Id"],
+        language_code=row.get("Language Code", ""),
+        place_code=row.get("Place Code", ""),
+        material_type=row.get("Material Type", ""),
+        resource_type=row.get("Resource Type", ""),
+    )
+    fields = []
+    for data in parse_962_fields(row["962 - Local Param 02"]):
+        fld = Field962(
+            bib_record=bib,
+            cat_center=data.cat_center,
+            cataloger=data.cataloger,
+            yyyymm=data.date[0:6],
+            difficulty=data.difficulty,
+            maint_info=data.maint_info,
+        )
+        # Repeatable subfields, each with a tuple of values
+        subfields = [
+            RepeatableSubfield(
+                field_962=fld,
+                subfield_code=sfd_code,
+                subfield_value=sfd_value,
+                yyyymm=fld.yyyymm,
+            )
+            for sfd_code, name in REPEATABLE_SUBFIELDS.items()
+            for sfd_value in getattr(data, name)
+        ]
+        fields.append((fld, subfields))
+    return bib, fields
+
+
+def parse_rows(report_data):
+    # Parse everything, keyed on MMS Id; if a bib occurs more than once,
+    # the last occurrence wins, as it did when rows were saved one at a time.
+    parsed_bibs = {}
     for row in report_data:
-        # Each row is one bib, with 1+ 962 fields embeded in 'Local Param 02'.
-        mmsid = row["MMS Id"]
-        # Remove existing bib (and all field/subfield children)
-        if BibRecord.objects.filter(mmsid=mmsid).exists():
-            replaced_bibs += 1
-            BibRecord.objects.filter(mmsid=mmsid).delete()
-
-        # TODO: Is this TRY needed? If so, improve the exception processing
         try:
-            # First save the bib-level data
-            bib = BibRecord.objects.create(
-                mmsid=mmsid,
-                language_code=row.get("Language Code", ""),
-                place_code=row.get("Place Code", ""),
-                material_type=row.get("Material Type", ""),
-                resource_type=row.get("Resource Type", ""),
-            )
-            # Split rows where Local Param 02 contains multiple 962 fields, delimited by ';'
-            for fld_962 in row["962 - Local Param 02"].split(";"):
-                r = fld_962.strip()
-                # Creates dict of lists, which is a pain
-                sfd_dict = defaultdict(list)
-                for subfield in r.split("$$")[1:]:
-                    code, value = subfield.strip().split(" ", 1)
-                    sfd_dict[code].append(value)
-                # Finally, create a Field962 linked to the BibRecord.
-                fld = Field962.objects.create(
-                    bib_record=bib,
-                    cat_center=sfd_dict.get("a", [""])[0],
-                    cataloger=sfd_dict.get("b", [""])[0],
-                    yyyymm=sfd_dict.get("c", [""])[0][0:6],
-                    difficulty=sfd_dict.get("d", [""])[0],
-                    maint_info=sfd_dict.get("g", [""])[0],
-                )
-                # Repeatable subfields
-                for sfd_code in ["h", "i", "j", "k"]:
-                    sfd_list = sfd_dict.get(sfd_code, None)
-                    if sfd_list:
-                        for sfd_value in sfd_list:
-                            RepeatableSubfield.objects.create(
-                                field_962=fld,
-                                subfield_code=sfd_code,
-                                subfield_value=sfd_value,
-                            )
+            bib, fields = parse_row(row)
         except Exception as ex:
-            print(ex)
-            pp.pprint(row)
+            logger.error(f"ERROR: Skipping unparseable row: {ex}")
+            logger.error(pp.pformat(row))
+        else:
+            parsed_bibs[bib.mmsid] = (bib, fields)
+    return parsed_bibs
 
-    # end for row in report_data
+
+def add_data_to_db(report_data):
+    # report_data can be any iterable of rows, including the run_report() generator.
+    # Rows are loaded in batches, each in its own transaction, so memory use
+    # depends on the batch size rather than the number of rows.
+    total_rows = 0
+    replaced_bibs = 0
+    for batch in iter_batches(report_data, LOAD_BATCH_SIZE):
+        total_rows += len(batch)
+        replaced_bibs += add_batch_to_db(batch)
+
+    logger.info(f"{total_rows = }")
     logger.info(f"{replaced_bibs = }")
     logger.info(f"{BibRecord.objects.count() = }")
     logger.info(f"{Field962.objects.count() = }")
     logger.info(f"{RepeatableSubfield.objects.count() = }")
 
 
+def add_batch_to_db(rows):
+    # Returns the number of existing bibs which were replaced.
+    with progress.timed("parse"):
+        parsed_bibs = parse_rows(rows)
+
+    bibs = [bib for bib, _ in parsed_bibs.values()]
+    fields = [fld for _, flds in parsed_bibs.values() for fld, _ in flds]
+    subfields = [
+        sfd for _, flds in parsed_bibs.values() for _, sfds in flds for sfd in sfds
+    ]
+
+    # Months of the new fields, and of the fields they replace
+    changed_months = {fld.yyyymm for fld in fields}
+    # All or nothing per batch: don't leave bibs deleted but not replaced.
+    with progress.timed("db"), transaction.atomic():
+        # Remove existing bibs (and all field/subfield children)
+        replaced_bibs = 0
+        mmsids = list(parsed_bibs)
+        for start in range(0, len(mmsids), BULK_BATCH_SIZE):
+            batch_mmsids = mmsids[start : start + BULK_BATCH_SIZE]
+            changed_months.update(
+                Field962.objects.filter(bib_record__mmsid__in=batch_mmsids)
+                .values_list("yyyymm", flat=True)
+                .distinct()
+            )
+            _, deleted = BibRecord.objects.filter(mmsid__in=batch_mmsids).delete()
+            replaced_bibs += deleted.get(BibRecord._meta.label, 0)
+
+        # Parents first, so children pick up their new foreign keys.
+        BibRecord.objects.bulk_create(bibs, batch_size=BULK_BATCH_SIZE)
+        Field962.objects.bulk_create(fields, batch_size=BULK_BATCH_SIZE)
+        RepeatableSubfield.objects.bulk_create(subfields, batch_size=BULK_BATCH_SIZE)
+
+    progress.changed_months.update(changed_months)
+    progress.add(rows_loaded=len(bibs))
+    progress.update()
+    return replaced_bibs
+
+
 def list_to_string(list):
     return ", ".join(list)
 
 
-def refresh_all_data():
-    # Start with clean database, removing bibs and related fields
-    BibRecord.objects.all().delete()
+class CopyLoader:
+    # Loads parsed rows into empty catstats tables with PostgreSQL
+    # COPY ... FROM STDIN, for full reloads only.
+    # COPY can't return generated ids, so ids are assigned here, starting
+    # from 1 after the tables are truncated, and sequences are reset at the end.
+
+    # Parents first, so foreign keys are valid as soon as each table is loaded.
+    models = [BibRecord, Field962, RepeatableSubfield]
+    # Models whose Meta.indexes can be dropped during the load
+    indexed_models = [Field962, RepeatableSubfield]
+
+    def __init__(self, drop_indexes=False):
+        if connection.vendor != "postgresql":
+            raise CommandError("--fast-load requires PostgreSQL")
+        self.drop_indexes = drop_indexes
+        self.next_ids = {model: 1 for model in self.models}
+        # MMS Ids already loaded: the same bib is returned for every year
+        # it has a 962 field, but should be loaded only once.
+        self.loaded_mmsids = set()
+        # (model, index) dropped by start(), to be rebuilt by finish()
+        self.dropped_indexes = []
+
+    def start(self):
+        # Call finish() afterwards even if this fails, to restore any
+        # indexes already dropped.
+        truncate_tables(self.models)
+        if self.drop_indexes:
+            for model in self.indexed_models:
+                for index in model._meta.indexes:
+                    logger.info(f"Dropping index {index.name}")
+                    with connection.schema_editor() as editor:
+                        editor.remove_index(model, index)
+                    self.dropped_indexes.append((model, index))
+
+    def finish(self):
+        with progress.timed("db"):
+            self.rebuild()
+        logger.info(f"{BibRecord.objects.count() = }")
+        logger.info(f"{Field962.objects.count() = }")
+        logger.info(f"{RepeatableSubfield.objects.count() = }")
+
+    def rebuild(self):
+        while self.dropped_indexes:
+            model, index = self.dropped_indexes[0]
+            logger.info(f"Rebuilding index {index.name}")
+            with connection.schema_editor() as editor:
+                editor.add_index(model, index)
+            self.dropped_indexes.pop(0)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), self.models):
+                cursor.execute(sql)
+            for model in self.models:
+                cursor.execute(
+                    f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}"
+                )
+
+    def assign_id(self, obj):
+        obj.pk = self.next_ids[type(obj)]
+        self.next_ids[type(obj)] += 1
+
+    def load(self, report_data):
+        # Like add_data_to_db(), consumes any iterable of rows in batches.
+        total_rows = 0
+        copied_bibs = 0
+        for batch in iter_batches(report_data, LOAD_BATCH_SIZE):
+            total_rows += len(batch)
+            copied_bibs += self.load_batch(batch)
+        logger.info(f"{total_rows = }")
+        logger.info(f"{copied_bibs = }")
+
+    def load_batch(self, rows):
+        # Returns the number of bibs copied.
+        with progress.timed("parse"):
+            parsed_bibs = parse_rows(rows)
+        objects = {model: [] for model in self.models}
+        for mmsid, (bib, fields) in parsed_bibs.items():
+            if mmsid in self.loaded_mmsids:
+                continue
+            self.assign_id(bib)
+            objects[BibRecord].append(bib)
+            for fld, subfields in fields:
+                self.assign_id(fld)
+                fld.bib_record_id = bib.pk
+                objects[Field962].append(fld)
+                for sfd in subfields:
+                    self.assign_id(sfd)
+                    sfd.field_962_id = fld.pk
+                    objects[RepeatableSubfield].append(sfd)
+
+        with progress.timed("db"), transaction.atomic():
+            with connection.cursor() as cursor:
+                for model in self.models:
+                    self.copy_objects(cursor, model, objects[model])
+        # Only once committed, so a failed year can be retried.
+        self.loaded_mmsids.update(bib.mmsid for bib in objects[BibRecord])
+        progress.add(rows_loaded=len(objects[BibRecord]))
+        progress.update()
+        return len(objects[BibRecord])
+
+    def copy_objects(self, cursor, model, objs):
+        fields = model._meta.concrete_fields
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+        # Django's cursor wraps the psycopg 3 cursor, which provides copy().
+        with cursor.cursor.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+            for obj in objs:
+                copy.write_row([getattr(obj, f.attname) for f in fields])
+
+
+def fetch_year(key, batches, cancelled):
+    # Fetch one attempt at a year, in a worker thread; see load_years().
+    # Puts (key, batch) on the batches queue for each LOAD_BATCH_SIZE rows,
+    # then (key, None) when finished, or (key, exception) if fetching failed.
+    # Gives up as soon as cancelled is set.
+    def put(item):
+        # Waits while the queue is full, unless cancelled.
+        while not cancelled.is_set():
+            try:
+                batches.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    year, _ = key
+    try:
+        for batch in iter_batches(run_report(year), LOAD_BATCH_SIZE):
+            if not put((key, batch)):
+                return
+    except Exception as ex:
+        put((key, ex))
+    else:
+        put((key, None))
+
+
+def load_years(years, load_batch, workers=1):
+    # load_batch is called with each batch of up to LOAD_BATCH_SIZE rows.
+    # Returns the list of years which could not be loaded.
+    failed_years = []
+    if workers == 1:
+        # Nothing to overlap with: stream each year straight into the database.
+        for year in years:
+            # Analytics API calls can fail for various reasons
+            # Try any given year 3 times, then move on.
+            for attempt in range(1, 4):
+                try:
+                    for batch in iter_batches(run_report(year), LOAD_BATCH_SIZE):
+                        load_batch(batch)
+                except Exception as ex:
+                    logger.error(f"ERROR: Failure {attempt} at {year}: {ex}")
+                else:
+                    break
+            else:
+                logger.error(f"ERROR: Total failure for {year}")
+                failed_years.append(year)
+        return failed_years
+
+    # Fetch up to `workers` years from Analytics at once, since network wait
+    # dominates, but load their batches one at a time here, in the only thread
+    # which uses the database.  Fetching waits while `workers` batches are
+    # waiting to be loaded, so memory use depends on the batch size and
+    # number of workers, not the size of a year.
+    batches = queue.Queue(maxsize=workers)
+    pending_years = list(years)
+    attempts = {}
+    # Cancellation events of attempts in progress, keyed on (year, attempt)
+    active = {}
+
+    def fetch_next_year():
+        year = pending_years.pop(0)
+        attempts[year] = attempts.get(year, 0) + 1
+        key = (year, attempts[year])
+        active[key] = threading.Event()
+        executor.submit(fetch_year, key, batches, active[key])
+
+    def fail(key, ex):
+        # Stop the attempt, and retry it if it hasn't failed 3 times.
+        active.pop(key).set()
+        year, attempt = key
+        logger.error(f"ERROR: Failure {attempt} at {year}: {ex}")
+        if attempt < 3:
+            # Retry as soon as possible, ahead of other years.
+            pending_years.insert(0, year)
+        else:
+            logger.error(f"ERROR: Total failure for {year}")
+            failed_years.append(year)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while active or pending_years:
+                while pending_years and len(active) < workers:
+                    fetch_next_year()
+                key, batch = batches.get()
+                if key not in active:
+                    # Left over from a failed attempt
+                    continue
+                if batch is None:
+                    del active[key]
+                elif isinstance(batch, Exception):
+                    fail(key, batch)
+                else:
+                    # Analytics API calls can fail for various reasons,
+                    # and so can loading: either way, the year is retried.
+                    try:
+                        load_batch(batch)
+                    except Exception as ex:
+                        fail(key, ex)
+        finally:
+            # If interrupted, stop all fetching, so the executor can shut down.
+            for cancelled in active.values():
+                cancelled.set()
+    return failed_years
+
+
+def refresh_all_data(fast_load=False, drop_indexes=False, workers=1):
     # Years from 2007 to current year
     years = [y for y in range(dt.now().year, 2006, -1)]
+    if fast_load:
+        # Start with clean database, via TRUNCATE instead of ORM deletes
+        loader = CopyLoader(drop_indexes)
+        try:
+            loader.start()
+            failed_years = load_years(years, loader.load_batch, workers)
+        finally:
+            # Always restore indexes and sequences, even if interrupted.
+            loader.finish()
+    else:
+        # Start with clean database, removing bibs and related fields
+        with progress.timed("db"):
+            if connection.vendor == "postgresql":
+                truncate_tables([BibRecord, Field962, RepeatableSubfield])
+            else:
+                BibRecord.objects.all().delete()
+        failed_years = load_years(years, add_batch_to_db, workers)
+    record_years_loaded(years, failed_years)
+
+
+def get_months(start_yyyymm, end_yyyymm):
+    # All yyyymm values from start_yyyymm to end_yyyymm, inclusive.
+    months = []
+    year, month = int(start_yyyymm[0:4]), int(start_yyyymm[4:6])
+    while f"{year}{month:02}" <= end_yyyymm:
+        months.append(f"{year}{month:02}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def record_years_loaded(years, failed_years):
+    # After a full refresh, replace all load states with one per month,
+    # so incremental refreshes can start from here.
+    # Per-month counts come from the database, as years are fetched as a whole.
+    current_yyyymm = dt.now().strftime("%Y%m")
+    bib_counts = dict(
+        Field962.objects.values_list("yyyymm")
+        .annotate(count=Count("bib_record", distinct=True))
+        .order_by()
+    )
+    loaded_at = timezone.now()
+    states = []
     for year in years:
-        # Analytics API calls can fail for various reasons
-        # Try any given year 3 times, then move on.
+        for yyyymm in get_months(f"{year}01", min(f"{year}12", current_yyyymm)):
+            if year in failed_years:
+                states.append(
+                    LoadState(
+                        yyyymm=yyyymm,
+                        status=LoadState.Status.FAILED,
+                        error=f"Total failure for {year}",
+                    )
+                )
+            else:
+                states.append(
+                    LoadState(
+                        yyyymm=yyyymm,
+                        status=LoadState.Status.LOADED,
+                        row_count=bib_counts.get(yyyymm, 0),
+                        loaded_at=loaded_at,
+                    )
+                )
+    with transaction.atomic():
+        LoadState.objects.all().delete()
+        LoadState.objects.bulk_create(states)
+
+
+class RowChecksum:
+    # Order-independent checksum of report rows, as the sum of per-row hashes,
+    # since Analytics doesn't promise to return rows in the same order.
+    def __init__(self):
+        self.total = 0
+        self.row_count = 0
+
+    def track(self, rows):
+        # Pass rows through unchanged, adding each to the checksum.
+        for row in rows:
+            row_bytes = repr(sorted(row.items())).encode("utf-8")
+            self.total += int.from_bytes(hashlib.sha256(row_bytes).digest(), "big")
+            self.row_count += 1
+            yield row
+
+    def hexdigest(self):
+        return f"{self.total % 2**256:064x}"
+
+
+def refresh_month(yyyymm, only_if_changed=False):
+    # Fetch and load one month, recording the result in its LoadState.
+    # With only_if_changed, the month is fetched in full first, and not
+    # loaded if it matches the last successful load.
+    # Returns True if data was loaded.
+    state, _ = LoadState.objects.get_or_create(
+        yyyymm=yyyymm, defaults={"status": LoadState.Status.FAILED}
+    )
+    checksum = RowChecksum()
+    try:
+        report_data = checksum.track(run_report(yyyymm))
+        if only_if_changed:
+            # One month is small enough to hold in memory.
+            report_data = list(report_data)
+            if (
+                state.status == LoadState.Status.LOADED
+                and state.checksum == checksum.hexdigest()
+            ):
+                logger.info(f"No changes for {yyyymm}")
+                state.save()  # Updates checked_at
+                return False
+        add_data_to_db(report_data)
+    except Exception as ex:
+        state.status = LoadState.Status.FAILED
+        state.error = str(ex)
+        state.save()
+        raise
+
+    state.status = LoadState.Status.LOADED
+    state.row_count = checksum.row_count
+    state.checksum = checksum.hexdigest()
+    state.error = ""
+    state.loaded_at = timezone.now()
+    state.save()
+    return True
+
+
+def get_incremental_months(recent_months):
+    # Months to refresh: the most recent `recent_months` months (which may
+    # still be changing), any months since the last one loaded, and any which
+    # failed last time.
+    current_yyyymm = dt.now().strftime("%Y%m")
+    months = set(get_months("200701", current_yyyymm)[-recent_months:])
+    last_loaded = (
+        LoadState.objects.filter(status=LoadState.Status.LOADED)
+        .order_by("-yyyymm")
+        .values_list("yyyymm", flat=True)
+        .first()
+    )
+    if last_loaded:
+        months.update(get_months(last_loaded, current_yyyymm))
+    months.update(
+        LoadState.objects.filter(status=LoadState.Status.FAILED).values_list(
+            "yyyymm", flat=True
+        )
+    )
+    return sorted(months, reverse=True)
+
+
+def refresh_incremental_data(recent_months):
+    months = get_incremental_months(recent_months)
+    logger.info(f"Incremental refresh for {months = }")
+    for yyyymm in months:
+        # As with full refreshes, try any given month 3 times, then move on.
         for attempt in range(1, 4):
             try:
-                report_data = run_report(year)
-                add_data_to_db(report_data)
+                refresh_month(yyyymm, only_if_changed=True)
             except Exception as ex:
-                logger.error(f"ERROR: Failure {attempt} at {year}: {ex}")
+                logger.error(f"ERROR: Failure {attempt} at {yyyymm}: {ex}")
             else:
                 break
         else:
-            print(f"ERROR: Total failure for {year}")
+            logger.error(f"ERROR: Total failure for {yyyymm}")
 
 
 class Command(BaseCommand):
@@ -225,13 +705,82 @@ class Command(BaseCommand):
             "--yyyymm",
             type=str,
             required=True,
-            help="YYYYMM to fetch data for, or ALL",
+            help="YYYYMM to fetch data for, ALL, or INCREMENTAL",
         )
+        parser.add_argument(
+            "--skip-warm-up",
+            action="store_true",
+            help="Don't cache common reports after loading data",
+        )
+        parser.add_argument(
+            "--recent-months",
+            type=int,
+            default=2,
+            help="With INCREMENTAL: number of most recent months to always check",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=4,
+            help="With ALL: number of years to fetch from Analytics at once",
+        )
+        parser.add_argument(
+            "--fast-load",
+            action="store_true",
+            help="With ALL: truncate tables and load with PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--drop-indexes",
+            action="store_true",
+            help="With --fast-load: drop indexes during the load, then rebuild them",
+        )
+        # Set by catstats.jobs, to link the job to this run's LoadRun
+        parser.add_argument("--load-job", type=int, help=argparse.SUPPRESS)
 
     def handle(self, *args, **options):
         yyyymm = options["yyyymm"]
-        if yyyymm == "ALL":
-            refresh_all_data()
-        else:
-            report_data = run_report(yyyymm)
-            add_data_to_db(report_data)
+        if options["fast_load"] and yyyymm != "ALL":
+            raise CommandError("--fast-load can only be used with -m ALL")
+        if options["recent_months"] < 1:
+            raise CommandError("--recent-months must be at least 1")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options["drop_indexes"] and not options["fast_load"]:
+            raise CommandError("--drop-indexes can only be used with --fast-load")
+        # Including next year's, so data never goes to the default partition
+        # at the turn of the year.
+        ensure_partitions(range(2007, dt.now().year + 2))
+        progress.start(yyyymm)
+        if options["load_job"] is not None:
+            LoadJob.objects.filter(pk=options["load_job"]).update(load_run=progress.run)
+        try:
+            try:
+                if yyyymm == "ALL":
+                    refresh_all_data(
+                        options["fast_load"],
+                        options["drop_indexes"],
+                        options["workers"],
+                    )
+                elif yyyymm == "INCREMENTAL":
+                    refresh_incremental_data(options["recent_months"])
+                else:
+                    refresh_month(yyyymm)
+                # Only for months whose data changed, unless all data was
+                # replaced, and not after errors.
+                if yyyymm == "ALL":
+                    rebuild_rollups()
+                elif progress.changed_months:
+                    rebuild_rollups(sorted(progress.changed_months))
+            finally:
+                # Cached report results are now out of date, even after errors,
+                # as some data may have changed.
+                bump_data_version()
+        except BaseException as ex:
+            # Including errors rebuilding rollups, and interruptions,
+            # so the run is never left running.
+            progress.finish(error=ex)
+            raise
+        progress.finish()
+        if not options["skip_warm_up"]:
+            warm_report_cache()
@@ -0,0 +1,85 @@
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from catstats.analytics_server import make_server
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve synthetic data from a local stand-in for the Alma Analytics "
+        "reports API; set ALMA_API_BASE_URL to its URL to load data from it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--host", type=str, default="127.0.0.1", help="Address to listen on"
+        )
+        parser.add_argument("--port", type=int, default=8001, help="Port to listen on")
+        parser.add_argument(
+            "--rows-per-month",
+            type=int,
+            default=5000,
+            help="Number of rows (bibs) in each month's data",
+        )
+        parser.add_argument(
+            "--max-fields",
+            type=int,
+            default=4,
+            help="Largest number of 962 fields per bib (most have 1)",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed, for repeatable data"
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds to wait before every response",
+        )
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=0.0,
+            help="Up to this many more seconds to wait, at random",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests to fail, from 0 to 1",
+        )
+        parser.add_argument(
+            "--error-status",
+            type=int,
+            default=503,
+            help="HTTP status of failed requests",
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options["rows_per_month"] < 100000:
+            raise CommandError("--rows-per-month must be from 1 to 99999")
+        if not 0 <= options["error_rate"] <= 1:
+            raise CommandError("--error-rate must be from 0 to 1")
+        server = make_server(
+            options["host"],
+            options["port"],
+            rows_per_month=options["rows_per_month"],
+            max_fields=options["max_fields"],
+            seed=options["seed"],
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            error_status=options["error_status"],
+        )
+        host, port = server.server_address[0:2]
+        self.stdout.write(
+            f"Serving Analytics reports at http://{host}:{port} - "
+            f"set ALMA_API_BASE_URL=http://{host}:{port} to use it"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
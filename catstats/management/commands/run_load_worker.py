@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from catstats.jobs import POLL_SECONDS, run_queued_jobs, run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run data loads queued from the web (see load_data), one at a time, "
+        "until stopped"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-seconds",
+            type=int,
+            default=POLL_SECONDS,
+            help="Seconds to wait between checks for queued loads",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run any queued loads, then exit, as from cron",
+        )
+
+    def handle(self, *args, **options):
+        if options["poll_seconds"] < 1:
+            raise CommandError("--poll-seconds must be at least 1")
+        if options["once"]:
+            run_queued_jobs()
+        else:
+            run_worker(options["poll_seconds"])
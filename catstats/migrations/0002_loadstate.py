@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoadState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("yyyymm", models.CharField(max_length=6, unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("loaded", "Loaded"), ("failed", "Failed")],
+                        max_length=10,
+                    ),
+                ),
+                ("row_count", models.IntegerField(default=0)),
+                ("checksum", models.CharField(blank=True, max_length=64)),
+                ("error", models.TextField(blank=True)),
+                ("loaded_at", models.DateTimeField(null=True)),
+                ("checked_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0002_loadstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Field962Rollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("yyyymm", models.CharField(max_length=6)),
+                ("cat_center", models.CharField(max_length=20)),
+                ("cataloger", models.CharField(max_length=20)),
+                ("language_code", models.CharField(max_length=3)),
+                ("place_code", models.CharField(max_length=3)),
+                ("resource_type", models.CharField(max_length=50)),
+                ("difficulty", models.CharField(max_length=20)),
+                ("maint_info", models.CharField(max_length=20)),
+                ("count", models.IntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["yyyymm", "cat_center"],
+                        name="catstats_fi_yyyymm_5f7dbe_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="SubfieldRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("yyyymm", models.CharField(max_length=6)),
+                ("cat_center", models.CharField(max_length=20)),
+                ("cataloger", models.CharField(max_length=20)),
+                ("language_code", models.CharField(max_length=3)),
+                ("place_code", models.CharField(max_length=3)),
+                ("resource_type", models.CharField(max_length=50)),
+                ("subfield_code", models.CharField(max_length=1)),
+                ("subfield_value", models.CharField(max_length=50)),
+                ("count", models.IntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["yyyymm", "cat_center"],
+                        name="catstats_su_yyyymm_c393f3_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_bibs(apps, schema_editor):
+    # Overlapping loads could leave more than one copy of a bib; keep the
+    # most recently loaded one, before mmsid is made unique.
+    BibRecord = apps.get_model("catstats", "BibRecord")
+    duplicates = (
+        BibRecord.objects.values("mmsid")
+        .annotate(bib_count=Count("id"), max_id=Max("id"))
+        .filter(bib_count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        BibRecord.objects.filter(
+            mmsid=duplicate["mmsid"], id__lt=duplicate["max_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0003_rollups"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bibs, migrations.RunPython.noop),
+    ]
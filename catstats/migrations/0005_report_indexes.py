@@ -0,0 +1,65 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0004_remove_duplicate_bibs"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="bibrecord",
+            name="catstats_bi_mmsid_bc0d4d_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="field962",
+            name="catstats_fi_yyyymm_aa593c_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="repeatablesubfield",
+            name="catstats_re_subfiel_facb9d_idx",
+        ),
+        migrations.AlterField(
+            model_name="repeatablesubfield",
+            name="field_962",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="catstats.field962",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="field962",
+            index=models.Index(
+                fields=["yyyymm", "cat_center", "difficulty"],
+                include=("bib_record", "maint_info"),
+                name="catstats_fi_report_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="repeatablesubfield",
+            index=models.Index(
+                fields=["field_962", "subfield_code"],
+                include=("subfield_value",),
+                name="catstats_re_field_962_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="repeatablesubfield",
+            index=models.Index(
+                fields=["subfield_code", "subfield_value"],
+                include=("field_962",),
+                name="catstats_re_value_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bibrecord",
+            constraint=models.UniqueConstraint(
+                fields=("mmsid",), name="catstats_unique_mmsid"
+            ),
+        ),
+    ]
@@ -0,0 +1,152 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:33
+
+import datetime
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Tables partitioned by year of yyyymm, on PostgreSQL only.
+PARTITIONED_TABLES = ["catstats_field962", "catstats_repeatablesubfield"]
+FIRST_YEAR = 2007
+
+
+def copy_field_962_yyyymm(apps, schema_editor):
+    Field962 = apps.get_model("catstats", "Field962")
+    RepeatableSubfield = apps.get_model("catstats", "RepeatableSubfield")
+    RepeatableSubfield.objects.update(
+        yyyymm=Subquery(
+            Field962.objects.filter(id=OuterRef("field_962_id")).values("yyyymm")
+        )
+    )
+
+
+def rebuild_table(schema_editor, table, partitioned):
+    # Replace table with a copy, partitioned by year of yyyymm or not,
+    # keeping its data, indexes, foreign keys and id sequence.
+    # Partitioned tables can't have identity columns (before PostgreSQL 17),
+    # and their primary key must include the partition key.
+    cursor = schema_editor.connection.cursor()
+    old_table = f"{table}_old"
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+        AND NOT i.indisprimary
+        AND NOT EXISTS (SELECT FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        """,
+        [old_table],
+    )
+    index_defs = [
+        re.sub(r" ON (ONLY )?\S+ USING ", f" ON {table} USING ", row[0])
+        for row in cursor.fetchall()
+    ]
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('f', 'u')
+        """,
+        [old_table],
+    )
+    constraint_defs = cursor.fetchall()
+    for name, _ in constraint_defs:
+        cursor.execute(f"ALTER TABLE {old_table} DROP CONSTRAINT {name}")
+    # Index names must be unique, so the old ones go before creating new ones.
+    cursor.execute(
+        """
+        SELECT indexrelid::regclass::text FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT indisprimary
+        """,
+        [old_table],
+    )
+    for (index_name,) in cursor.fetchall():
+        cursor.execute(f"DROP INDEX {index_name}")
+
+    if partitioned:
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {old_table}) PARTITION BY RANGE (yyyymm)"
+        )
+        for year in range(FIRST_YEAR, datetime.date.today().year + 2):
+            cursor.execute(
+                f"CREATE TABLE {table}_{year} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{year}') TO ('{year + 1}')"
+            )
+        # Anything else, like yyyymm values missing from the data
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        cursor.execute(f"DROP TABLE {old_table}")
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, yyyymm)")
+        cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        cursor.execute(
+            f"ALTER TABLE {table} ALTER id SET DEFAULT nextval('{table}_id_seq')"
+        )
+        cursor.execute(
+            f"SELECT setval('{table}_id_seq', COALESCE(MAX(id), 0) + 1, false) "
+            f"FROM {table}"
+        )
+    else:
+        cursor.execute(f"CREATE TABLE {table} (LIKE {old_table})")
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        # Drops the partitions and the id sequence too
+        cursor.execute(f"DROP TABLE {old_table}")
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+        cursor.execute(
+            f"ALTER TABLE {table} ALTER id ADD GENERATED BY DEFAULT AS IDENTITY"
+        )
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+        )
+
+    for index_def in index_defs:
+        cursor.execute(index_def)
+    for name, constraint_def in constraint_defs:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {constraint_def}")
+    cursor.execute(f"ANALYZE {table}")
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        rebuild_table(schema_editor, table, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        rebuild_table(schema_editor, table, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0005_report_indexes"),
+    ]
+
+    operations = [
+        # Field962.id alone is no longer unique once the table is partitioned.
+        migrations.AlterField(
+            model_name="repeatablesubfield",
+            name="field_962",
+            field=models.ForeignKey(
+                db_constraint=False,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="catstats.field962",
+            ),
+        ),
+        migrations.AddField(
+            model_name="repeatablesubfield",
+            name="yyyymm",
+            field=models.CharField(default="", max_length=6),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_field_962_yyyymm, migrations.RunPython.noop),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
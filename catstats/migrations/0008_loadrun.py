@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0007_loadjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoadRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("yyyymm", models.CharField(max_length=11)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="running",
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(null=True)),
+                ("pages_fetched", models.IntegerField(default=0)),
+                ("rows_fetched", models.IntegerField(default=0)),
+                ("rows_loaded", models.IntegerField(default=0)),
+                ("http_seconds", models.FloatField(default=0)),
+                ("xml_seconds", models.FloatField(default=0)),
+                ("parse_seconds", models.FloatField(default=0)),
+                ("db_seconds", models.FloatField(default=0)),
+            ],
+        ),
+    ]
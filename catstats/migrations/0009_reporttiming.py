@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0008_loadrun"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportTiming",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("report", models.CharField(max_length=2)),
+                ("filters", models.JSONField()),
+                ("cached", models.BooleanField(default=False)),
+                ("query_count", models.IntegerField(default=0)),
+                ("db_seconds", models.FloatField(default=0)),
+                ("pivot_seconds", models.FloatField(default=0)),
+                ("render_seconds", models.FloatField(default=0)),
+                ("total_seconds", models.FloatField(default=0)),
+                ("row_count", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
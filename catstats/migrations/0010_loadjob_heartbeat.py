@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0009_reporttiming"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loadjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="loadjob",
+            name="hostname",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="loadjob",
+            name="pid",
+            field=models.IntegerField(null=True),
+        ),
+    ]
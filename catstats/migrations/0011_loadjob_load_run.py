@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0010_loadjob_heartbeat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loadjob",
+            name="load_run",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="catstats.loadrun",
+            ),
+        ),
+    ]
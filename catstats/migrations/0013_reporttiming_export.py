@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catstats", "0012_dataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reporttiming",
+            name="export",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class BibRecord(models.Model):
@@ -10,13 +11,18 @@ class BibRecord(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=["mmsid"]),
             models.Index(fields=["language_code"]),
             models.Index(fields=["place_code"]),
         ]
+        constraints = [
+            # Also the index for finding bibs to replace
+            models.UniqueConstraint(fields=["mmsid"], name="catstats_unique_mmsid"),
+        ]
 
 
 class Field962(models.Model):
+    # On PostgreSQL, this and RepeatableSubfield are partitioned by year
+    # of yyyymm; see catstats.partitions.
     # Subfields can be repeatable (R) or non-repeatable (NR).
     # Repeatable subfields are stored as 'val1, val2...' which is OK for this purpose.
     bib_record = models.ForeignKey(BibRecord, on_delete=models.CASCADE)
@@ -35,18 +41,223 @@ class Field962(models.Model):
         indexes = [
             models.Index(fields=["cat_center"]),
             models.Index(fields=["cataloger"]),
-            models.Index(fields=["yyyymm"]),
+            # Every report filters on a yyyymm range, usually a cat center,
+            # and groups on difficulty; the bib is needed for resource type.
+            # Also covers queries on yyyymm alone.
+            models.Index(
+                fields=["yyyymm", "cat_center", "difficulty"],
+                include=["bib_record", "maint_info"],
+                name="catstats_fi_report_idx",
+            ),
         ]
 
 
 class RepeatableSubfield(models.Model):
-    field_962 = models.ForeignKey(Field962, on_delete=models.CASCADE)
+    # Indexed by the first column of catstats_re_field_962_idx instead.
+    # On PostgreSQL, Field962 is partitioned, and its primary key includes yyyymm,
+    # so there can't be a database constraint for this; Django still handles
+    # cascading deletes.
+    field_962 = models.ForeignKey(
+        Field962, on_delete=models.CASCADE, db_index=False, db_constraint=False
+    )
     # for repeatable 962 $h, $i, $j, $k
     subfield_code = models.CharField(max_length=1)
     subfield_value = models.CharField(max_length=50)
+    # Copy of field_962.yyyymm, for partitioning and filtering like Field962
+    yyyymm = models.CharField(max_length=6)
 
     class Meta:
         indexes = [
-            models.Index(fields=["subfield_code"]),
             models.Index(fields=["subfield_value"]),
+            # Subfield reports: given subfield codes for a set of 962 fields.
+            models.Index(
+                fields=["field_962", "subfield_code"],
+                include=["subfield_value"],
+                name="catstats_re_field_962_idx",
+            ),
+            # 962 $k (project) filter: 962 fields with a given code and value.
+            models.Index(
+                fields=["subfield_code", "subfield_value"],
+                include=["field_962"],
+                name="catstats_re_value_idx",
+            ),
         ]
+
+
+class LoadState(models.Model):
+    # Most recent load of one month of Analytics data (962 $c yyyymm),
+    # used by incremental refreshes to decide which months to fetch again.
+    class Status(models.TextChoices):
+        LOADED = "loaded"
+        FAILED = "failed"
+
+    yyyymm = models.CharField(max_length=6, unique=True)
+    status = models.CharField(max_length=10, choices=Status.choices)
+    # Analytics rows (bibs) loaded for the month
+    row_count = models.IntegerField(default=0)
+    # Order-independent checksum of the rows; blank if loaded as part of a year.
+    checksum = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    loaded_at = models.DateTimeField(null=True)
+    checked_at = models.DateTimeField(auto_now=True)
+
+
+class Field962Rollup(models.Model):
+    # Field962 counts, pre-aggregated on every value reports filter or group on,
+    # except 962 $k (project); rebuilt after each data refresh.
+    yyyymm = models.CharField(max_length=6)
+    cat_center = models.CharField(max_length=20)
+    cataloger = models.CharField(max_length=20)
+    language_code = models.CharField(max_length=3)
+    place_code = models.CharField(max_length=3)
+    resource_type = models.CharField(max_length=50)
+    difficulty = models.CharField(max_length=20)
+    maint_info = models.CharField(max_length=20)
+    count = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["yyyymm", "cat_center"]),
+        ]
+
+
+class SubfieldRollup(models.Model):
+    # RepeatableSubfield counts for 962 $h, $i and $j, pre-aggregated like
+    # Field962Rollup; rebuilt after each data refresh.
+    yyyymm = models.CharField(max_length=6)
+    cat_center = models.CharField(max_length=20)
+    cataloger = models.CharField(max_length=20)
+    language_code = models.CharField(max_length=3)
+    place_code = models.CharField(max_length=3)
+    resource_type = models.CharField(max_length=50)
+    subfield_code = models.CharField(max_length=1)
+    subfield_value = models.CharField(max_length=50)
+    count = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["yyyymm", "cat_center"]),
+        ]
+
+
+class DataVersion(models.Model):
+    # Current version of the catstats data, changed whenever it's refreshed,
+    # so earlier cached report results are ignored; see catstats.reports.
+    # One row, kept here as cache entries can be culled at any time.
+    version = models.CharField(max_length=32)
+    changed_at = models.DateTimeField(auto_now=True)
+
+
+class LoadJob(models.Model):
+    # A requested run of refresh_analytics_data, queued from the load_data view
+    # and run one at a time by catstats.jobs.
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    # Any value accepted by refresh_analytics_data -m: YYYYMM, ALL or INCREMENTAL
+    yyyymm = models.CharField(max_length=11)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    # Analytics rows (bibs) loaded by the job's run of refresh_analytics_data
+    rows_loaded = models.IntegerField(null=True)
+    # That run, once started
+    load_run = models.ForeignKey("LoadRun", null=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # Where a running job runs, and when its process last said it was still
+    # running it; see catstats.jobs.
+    hostname = models.CharField(max_length=255, blank=True)
+    pid = models.IntegerField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            # Requests for data already queued or loading share the same job.
+            models.UniqueConstraint(
+                fields=["yyyymm"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="catstats_unique_active_load_job",
+            ),
+        ]
+
+    @property
+    def duration(self):
+        # Seconds spent running, so far if not finished
+        if self.started_at is None:
+            return None
+        end_time = self.finished_at or timezone.now()
+        return (end_time - self.started_at).total_seconds()
+
+
+class LoadRun(models.Model):
+    # Progress and timings of one refresh_analytics_data run, for seeing where
+    # load time goes, and spotting regressions from run to run.
+    class Status(models.TextChoices):
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    # refresh_analytics_data -m value: YYYYMM, ALL or INCREMENTAL
+    yyyymm = models.CharField(max_length=11)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.RUNNING
+    )
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+    # Analytics report pages and rows (bibs) fetched, and bibs written
+    pages_fetched = models.IntegerField(default=0)
+    rows_fetched = models.IntegerField(default=0)
+    rows_loaded = models.IntegerField(default=0)
+    # Seconds spent in each stage.  Pages are fetched ahead, in other threads,
+    # so these can add up to more than the elapsed time.
+    http_seconds = models.FloatField(default=0)
+    xml_seconds = models.FloatField(default=0)
+    parse_seconds = models.FloatField(default=0)
+    db_seconds = models.FloatField(default=0)
+
+    @property
+    def elapsed_seconds(self):
+        end_time = self.finished_at or timezone.now()
+        return (end_time - self.started_at).total_seconds()
+
+    @property
+    def rows_parsed_per_second(self):
+        if not self.parse_seconds:
+            return None
+        return self.rows_fetched / self.parse_seconds
+
+    @property
+    def rows_loaded_per_second(self):
+        if not self.db_seconds:
+            return None
+        return self.rows_loaded / self.db_seconds
+
+
+class ReportTiming(models.Model):
+    # Where the time went in one report request, for deciding which reports
+    # need rollups or indexes; see report_timings.
+    report = models.CharField(max_length=2)
+    # Normalized filters, as from get_report_filters()
+    filters = models.JSONField()
+    # Whether results came from the cache, in which case there's no pivot time.
+    cached = models.BooleanField(default=False)
+    # Whether results were exported as CSV, which is streamed after the
+    # timing is recorded, so its render time isn't known.
+    export = models.BooleanField(default=False)
+    query_count = models.IntegerField(default=0)
+    # Seconds spent running queries, in Python building report rows from
+    # their results, rendering the response, and in total
+    db_seconds = models.FloatField(default=0)
+    pivot_seconds = models.FloatField(default=0)
+    render_seconds = models.FloatField(default=0)
+    total_seconds = models.FloatField(default=0)
+    # Report rows, including totals
+    row_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
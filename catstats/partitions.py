@@ -0,0 +1,64 @@
+# Yearly partitions of the Field962 and RepeatableSubfield tables, on PostgreSQL.
+# Rows are routed to the partition for the year of their yyyymm; reports
+# filter on yyyymm, so they read only the partitions for the years they cover.
+# Tables are partitioned by migration 0006; this adds partitions for new years.
+import logging
+from django.db import connection, transaction
+from catstats.models import Field962, RepeatableSubfield
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_MODELS = [Field962, RepeatableSubfield]
+
+
+def is_partitioned(model):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        return cursor.fetchone()[0] == "p"
+
+
+def get_partition_name(model, year):
+    return f"{model._meta.db_table}_{year}"
+
+
+def ensure_partitions(years):
+    # Create any missing partitions for years, moving their rows out of the
+    # default partition if needed, so new data never piles up there.
+    for model in PARTITIONED_MODELS:
+        if not is_partitioned(model):
+            continue
+        table = model._meta.db_table
+        for year in years:
+            partition = get_partition_name(model, year)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s)", [partition])
+                if cursor.fetchone()[0] is not None:
+                    continue
+                logger.info(f"Creating partition {partition}")
+                bounds = f"FROM ('{year}') TO ('{year + 1}')"
+                with transaction.atomic():
+                    cursor.execute(
+                        f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)"
+                    )
+                    cursor.execute(
+                        f"WITH moved AS (DELETE FROM {table}_default "
+                        f"WHERE yyyymm >= %s AND yyyymm < %s RETURNING *) "
+                        f"INSERT INTO {partition} SELECT * FROM moved",
+                        [str(year), str(year + 1)],
+                    )
+                    cursor.execute(
+                        f"ALTER TABLE {table} ATTACH PARTITION {partition} "
+                        f"FOR VALUES {bounds}"
+                    )
+
+
+def truncate_tables(models):
+    # Much faster than ORM deletes for emptying whole tables (and partitions).
+    tables = ", ".join(connection.ops.quote_name(m._meta.db_table) for m in models)
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {tables} RESTART IDENTITY")
@@ -0,0 +1,360 @@
+# Report queries, and caching of their results.
+import hashlib
+import json
+import logging
+import math
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, OuterRef, Sum
+from django.utils import timezone
+from catstats.forms import CAT_CENTERS, REPORT_PERIODS, REPORTS
+from catstats.models import (
+    DataVersion,
+    Field962,
+    Field962Rollup,
+    RepeatableSubfield,
+    ReportTiming,
+    SubfieldRollup,
+)
+from catstats.rollups import ROLLUP_SUBFIELD_CODES, rollups_cover
+from catstats.view_utils import (
+    get_crosstab_data,
+    get_difficulties,
+    get_field_filters,
+    get_report_filters,
+    get_summary_data,
+)
+
+logger = logging.getLogger(__name__)
+
+# Report sources: 962 fields, or their repeatable subfields
+FIELDS = "fields"
+SUBFIELDS = "subfields"
+# Report layouts: counts by format (rows) and value (columns), or by value only
+CROSSTAB = "crosstab"
+SUMMARY = "summary"
+
+
+@dataclass(frozen=True)
+class ReportSpec:
+    # What a report counts and how it's laid out; get_report() does the rest.
+    source: str
+    layout: str
+    # Value to count by: crosstab columns, or summary rows
+    group_by: str
+    # Only count these difficulties, if any
+    difficulties: list = field(default_factory=list)
+    # Only count these subfields, for SUBFIELDS reports
+    subfield_codes: list = field(default_factory=list)
+    # Any other filters, as queryset keyword arguments
+    filters: dict = field(default_factory=dict)
+
+
+# Keys are report codes from forms.REPORTS.
+REPORT_SPECS = {
+    # New titles by format & difficulty
+    "01": ReportSpec(
+        FIELDS, CROSSTAB, "difficulty", difficulties=get_difficulties("01")
+    ),
+    # National contributions by format
+    "02": ReportSpec(SUBFIELDS, CROSSTAB, "subfield_value", subfield_codes=["h"]),
+    # Authority contributions
+    "03": ReportSpec(SUBFIELDS, SUMMARY, "subfield_value", subfield_codes=["i", "j"]),
+    # Maintenance by format & difficulty
+    "04": ReportSpec(
+        FIELDS, CROSSTAB, "difficulty", difficulties=get_difficulties("04")
+    ),
+    # Maintenance (broad)
+    "05": ReportSpec(
+        FIELDS, SUMMARY, "difficulty", difficulties=get_difficulties("05")
+    ),
+    # Maintenance (details)
+    "06": ReportSpec(FIELDS, SUMMARY, "maint_info", filters={"maint_info__gt": ""}),
+}
+
+
+def can_use_rollups(spec, filters):
+    return rollups_cover(filters) and set(spec.subfield_codes) <= set(
+        ROLLUP_SUBFIELD_CODES
+    )
+
+
+def get_rollup_data(spec, filters):
+    # Pre-aggregated data, much faster when available:
+    # sum the stored counts instead of counting raw records.
+    # Returns the queryset, count and format expressions.
+    model = Field962Rollup if spec.source == FIELDS else SubfieldRollup
+    report_data = model.objects.filter(**get_field_filters(filters))
+    return report_data, Sum("count"), F("resource_type")
+
+
+def get_raw_data(spec, filters):
+    # Same as get_rollup_data(), but from the raw tables.
+    # Project requires special handling as 962 $k is repeatable:
+    # keep only fields with a matching $k, as an EXISTS semi-join,
+    # using the (field_962, subfield_code) index.
+    project_subfields = RepeatableSubfield.objects.filter(
+        yyyymm__gte=filters["start_yyyymm"],
+        yyyymm__lte=filters["end_yyyymm"],
+        subfield_code__exact="k",
+        subfield_value__exact=filters["f962_k_code"],
+    )
+    if spec.source == FIELDS:
+        report_data = Field962.objects.filter(
+            **get_field_filters(filters, bib_prefix="bib_record__")
+        )
+        if filters["f962_k_code"] != "":
+            report_data = report_data.filter(
+                Exists(project_subfields.filter(field_962=OuterRef("pk")))
+            )
+        return report_data, Count("id"), F("bib_record__resource_type")
+
+    # Subfields are filtered on their own yyyymm (a copy of their field's,
+    # which limits them to the report period's partitions) and joined
+    # directly to their field and bib for the other filters.
+    report_data = RepeatableSubfield.objects.filter(
+        **get_field_filters(
+            filters,
+            field_prefix="field_962__",
+            bib_prefix="field_962__bib_record__",
+        )
+    )
+    if filters["f962_k_code"] != "":
+        report_data = report_data.filter(
+            Exists(project_subfields.filter(field_962=OuterRef("field_962")))
+        )
+    return report_data, Count("id"), F("field_962__bib_record__resource_type")
+
+
+def get_report(filters, use_rollups=True):
+    # Run the report for normalized filters (from get_report_filters()),
+    # returning column headers and rows for display.
+    # Uses rollups when they have everything the report needs, otherwise the
+    # raw tables; use_rollups=False forces the raw tables, for benchmarking.
+    spec = REPORT_SPECS[filters["report"]]
+    if use_rollups and can_use_rollups(spec, filters):
+        logger.debug(f"Report {filters['report']} from rollups")
+        report_data, count, format = get_rollup_data(spec, filters)
+    else:
+        logger.debug(f"Report {filters['report']} from raw tables")
+        report_data, count, format = get_raw_data(spec, filters)
+
+    if spec.difficulties:
+        report_data = report_data.filter(difficulty__in=spec.difficulties)
+    if spec.subfield_codes:
+        report_data = report_data.filter(subfield_code__in=spec.subfield_codes)
+    report_data = report_data.filter(**spec.filters)
+
+    if spec.layout == CROSSTAB:
+        # Get just the relevant data: List of dicts with group_by value, format, count
+        report_data = report_data.values(spec.group_by, format=format).annotate(
+            count=count
+        )
+        return get_crosstab_data(report_data, "format", spec.group_by)
+    # Generic headers
+    headers = ["Value", "Count"]
+    return headers, get_summary_data(report_data, spec.group_by, count)
+
+
+def get_data_version():
+    data_version = DataVersion.objects.values_list("version", flat=True).first()
+    if data_version is None:
+        # Never set: start a new version, which is always safe.
+        data_version = bump_data_version()
+    return data_version
+
+
+def bump_data_version():
+    # Called after data changes, so all previously cached results are ignored
+    # (and eventually expire).
+    data_version = uuid.uuid4().hex
+    DataVersion.objects.update_or_create(pk=1, defaults={"version": data_version})
+    return data_version
+
+
+def get_report_cache_key(filters):
+    filters_hash = hashlib.sha256(
+        json.dumps(filters, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"catstats:report:{get_data_version()}:{filters_hash}"
+
+
+def get_cached_report(filters, timer=None):
+    # Same as get_report(), but results are cached until the data changes.
+    # timer: optional ReportTimer, to record whether results were cached
+    cache_key = get_report_cache_key(filters)
+    report = cache.get(cache_key)
+    if report is None:
+        report = get_report(filters)
+        cache.set(cache_key, report)
+    elif timer is not None:
+        timer.timing.cached = True
+    return report
+
+
+class ReportTimer:
+    # Times one report request, saving the results in a ReportTiming.
+    # Use as a database execute wrapper, to count queries and their time:
+    #     with connection.execute_wrapper(timer):
+    #         with timer.timed("report"):
+    #             ...
+    #         with timer.timed("render"):
+    #             ...
+    #     timer.finish(row_count)
+    # Cache lookups, with DatabaseCache, aren't counted: cached requests
+    # show no queries, and the report's own queries aren't overstated.
+    def __init__(self, filters):
+        self.timing = ReportTiming(report=filters["report"], filters=filters)
+        self.start_time = perf_counter()
+        self.report_seconds = 0.0
+        self.cache_tables = [
+            options["LOCATION"]
+            for options in settings.CACHES.values()
+            if options["BACKEND"] == "django.core.cache.backends.db.DatabaseCache"
+        ]
+
+    def __call__(self, execute, sql, params, many, context):
+        if any(table in sql for table in self.cache_tables):
+            return execute(sql, params, many, context)
+        start_time = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timing.query_count += 1
+            self.timing.db_seconds += perf_counter() - start_time
+
+    @contextmanager
+    def timed(self, stage):
+        # Add the time spent in the with block to report or render seconds.
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start_time
+            if stage == "report":
+                self.report_seconds += seconds
+            else:
+                self.timing.render_seconds += seconds
+
+    def finish(self, row_count):
+        timing = self.timing
+        timing.row_count = row_count
+        # Queries run lazily, as report rows are built from them, so
+        # pivot time is whatever report time wasn't spent in the database.
+        timing.pivot_seconds = max(self.report_seconds - timing.db_seconds, 0.0)
+        timing.total_seconds = perf_counter() - self.start_time
+        timing.save()
+        # One line of JSON, easy to search for and parse
+        values = {
+            "report": timing.report,
+            "filters": timing.filters,
+            "cached": timing.cached,
+            "export": timing.export,
+            "query_count": timing.query_count,
+            "db_seconds": round(timing.db_seconds, 4),
+            "pivot_seconds": round(timing.pivot_seconds, 4),
+            "render_seconds": round(timing.render_seconds, 4),
+            "total_seconds": round(timing.total_seconds, 4),
+            "row_count": row_count,
+        }
+        logger.info(f"Report timing: {json.dumps(values, sort_keys=True)}")
+        return timing
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile of a list of numbers, or None if it's empty.
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+# Timings summarized by get_timing_summary(), in ReportTiming field order
+TIMING_SUMMARY_COLUMNS = [
+    "queries",
+    "db_seconds",
+    "pivot_seconds",
+    "render_seconds",
+    "total_seconds",
+    "rows",
+]
+
+
+def get_timing_summary(since):
+    # Median and 95th percentile timings per report, for requests since
+    # the given datetime.  Percentiles are of uncached requests only, as
+    # cached ones say nothing about the report's queries.  CSV exports are
+    # left out, as their render and total times don't include streaming.
+    timings = ReportTiming.objects.filter(
+        created_at__gte=since, export=False
+    ).values_list(
+        "report",
+        "cached",
+        "query_count",
+        "db_seconds",
+        "pivot_seconds",
+        "render_seconds",
+        "total_seconds",
+        "row_count",
+    )
+    by_report = {}
+    for report, cached, *values in timings:
+        report_timings = by_report.setdefault(report, {"requests": 0, "uncached": []})
+        report_timings["requests"] += 1
+        if not cached:
+            report_timings["uncached"].append(values)
+    report_names = dict(REPORTS)
+    summary = []
+    for report, report_timings in sorted(by_report.items()):
+        uncached = report_timings["uncached"]
+        report_summary = {
+            "report": report,
+            "name": report_names.get(report, ""),
+            "requests": report_timings["requests"],
+            "uncached": len(uncached),
+        }
+        for index, name in enumerate(TIMING_SUMMARY_COLUMNS):
+            values = [timing[index] for timing in uncached]
+            report_summary[f"{name}_p50"] = percentile(values, 50)
+            report_summary[f"{name}_p95"] = percentile(values, 95)
+        summary.append(report_summary)
+    return summary
+
+
+def get_warm_up_filters():
+    # Filters for every report and cat center, for each report period
+    # (current month, fiscal year and calendar year), with no optional filters.
+    # Built like form data, so cache keys match requests from the form.
+    today = timezone.localdate()
+    for report, _ in REPORTS:
+        for cat_center, _ in CAT_CENTERS:
+            for report_period, _ in REPORT_PERIODS:
+                form_data = {
+                    "report": report,
+                    "cat_center": cat_center,
+                    "year": str(today.year),
+                    "month": f"{today.month:02}",
+                    "report_period": report_period,
+                    "cataloger": "",
+                    "language_code": "",
+                    "place_code": "",
+                    "f962_k_code": "",
+                }
+                yield get_report_filters(form_data)
+
+
+def warm_report_cache():
+    # Run the most common reports after data changes, so their results are
+    # cached before anyone asks for them.
+    start_time = perf_counter()
+    report_count = 0
+    for filters in get_warm_up_filters():
+        get_cached_report(filters)
+        report_count += 1
+    logger.info(
+        f"Cached {report_count} reports in {perf_counter() - start_time:.1f} seconds"
+    )
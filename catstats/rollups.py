@@ -0,0 +1,90 @@
+# Pre-aggregated report data, rebuilt from the raw tables after each refresh,
+# for the months it reloaded.
+import logging
+from itertools import islice
+from django.db import transaction
+from django.db.models import Count, F
+from catstats.models import Field962, Field962Rollup, RepeatableSubfield, SubfieldRollup
+
+logger = logging.getLogger(__name__)
+
+# Number of rollup rows written per INSERT
+ROLLUP_BATCH_SIZE = 5000
+# 962 $k is left out, as it's used only for filtering.
+ROLLUP_SUBFIELD_CODES = ["h", "i", "j"]
+
+
+def get_field962_counts(months=None):
+    # Field962 counts grouped on every Field962Rollup value,
+    # for all months or only the given ones.
+    fields = Field962.objects.all()
+    if months is not None:
+        fields = fields.filter(yyyymm__in=months)
+    return (
+        fields.values(
+            "yyyymm",
+            "cat_center",
+            "cataloger",
+            "difficulty",
+            "maint_info",
+            language_code=F("bib_record__language_code"),
+            place_code=F("bib_record__place_code"),
+            resource_type=F("bib_record__resource_type"),
+        )
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+def get_subfield_counts(months=None):
+    # RepeatableSubfield counts grouped on every SubfieldRollup value,
+    # for all months or only the given ones.
+    subfields = RepeatableSubfield.objects.filter(
+        subfield_code__in=ROLLUP_SUBFIELD_CODES
+    )
+    if months is not None:
+        subfields = subfields.filter(yyyymm__in=months)
+    return (
+        subfields.values(
+            "subfield_code",
+            "subfield_value",
+            "yyyymm",
+            cat_center=F("field_962__cat_center"),
+            cataloger=F("field_962__cataloger"),
+            language_code=F("field_962__bib_record__language_code"),
+            place_code=F("field_962__bib_record__place_code"),
+            resource_type=F("field_962__bib_record__resource_type"),
+        )
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+def replace_rollup(model, counts, months=None):
+    rollup_rows = model.objects.all()
+    if months is not None:
+        rollup_rows = rollup_rows.filter(yyyymm__in=months)
+    rollup_rows.delete()
+    iterator = counts.iterator(chunk_size=ROLLUP_BATCH_SIZE)
+    while batch := list(islice(iterator, ROLLUP_BATCH_SIZE)):
+        model.objects.bulk_create([model(**values) for values in batch])
+    logger.info(f"{model.__name__}: {model.objects.count()} rows")
+
+
+def rebuild_rollups(months=None):
+    # Rebuild rollups for all months, or only the given ones (whose data
+    # was reloaded), as a whole-table rebuild takes much longer than one month.
+    if months is not None and not Field962Rollup.objects.exists():
+        # Never built: rollups of only some months would look complete.
+        months = None
+    logger.info(f"Rebuilding rollups for {'all months' if months is None else months}")
+    # In one transaction, so reports never see partly-built rollups.
+    with transaction.atomic():
+        replace_rollup(Field962Rollup, get_field962_counts(months), months)
+        replace_rollup(SubfieldRollup, get_subfield_counts(months), months)
+
+
+def rollups_cover(filters):
+    # Rollups cover every report filter except 962 $k, but only if they
+    # have been built.
+    return filters["f962_k_code"] == "" and Field962Rollup.objects.exists()
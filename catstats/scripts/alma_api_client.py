@@ -1,20 +1,44 @@
+import os
 import requests
+from requests.adapters import HTTPAdapter
 from time import sleep
+from urllib3.util.retry import Retry
 
 class Alma_Api_Client():
-	def __init__(self, api_key):
+	def __init__(self, api_key, timeout=(10, 300), max_retries=5, backoff_factor=2, base_url=None):
+		# timeout: seconds, as (connect, read) tuple or single number for both.
+		# max_retries / backoff_factor: for retrying connection errors and
+		# HTTP 429 / 5xx responses, waiting backoff_factor * 2^n seconds between
+		# tries unless the server sends Retry-After.
+		# base_url: defaults to ALMA_API_BASE_URL if set, e.g. for a local
+		# stand-in server (see run_analytics_server), else the real API.
 		self.API_KEY = api_key
-		self.BASE_URL = 'https://api-na.hosted.exlibrisgroup.com'
+		self.BASE_URL = (base_url or os.getenv('ALMA_API_BASE_URL') or 'https://api-na.hosted.exlibrisgroup.com').rstrip('/')
 		self.HEADERS = {
 			'Authorization': f'apikey {self.API_KEY}',
 			'Accept': 'application/json',
 			'Content-Type': 'application/json'
 			}
+		self.TIMEOUT = timeout
+		# Reuse connections across calls, instead of a new TLS connection per call.
+		# Retries apply only to idempotent methods (not POST), and the final
+		# response is returned as usual if all retries fail.
+		retry = Retry(
+			total=max_retries,
+			backoff_factor=backoff_factor,
+			status_forcelist=[429, 500, 502, 503, 504],
+			respect_retry_after_header=True,
+			raise_on_status=False,
+		)
+		self.session = requests.Session()
+		adapter = HTTPAdapter(max_retries=retry)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
 
 	def _call_get_api(self, api, parameters={}):
 		# parameters: optional dictionary
 		get_url = self.BASE_URL + api
-		response = requests.get(get_url, headers=self.HEADERS, params=parameters)
+		response = self.session.get(get_url, headers=self.HEADERS, params=parameters, timeout=self.TIMEOUT)
 		# Actually, a Python dictionary...
 		api_data = response.json()
 		# Add a few response elements caller can use
@@ -27,7 +51,7 @@ class Alma_Api_Client():
 
 	def _call_post_api(self, api, data, parameters={}):
 		post_url = self.BASE_URL + api
-		response = requests.post(post_url, headers=self.HEADERS, json=data, params=parameters)
+		response = self.session.post(post_url, headers=self.HEADERS, json=data, params=parameters, timeout=self.TIMEOUT)
 		# Actually, a Python dictionary...
 		api_data = response.json()
 		# Add a few response elements caller can use
@@ -40,7 +64,7 @@ class Alma_Api_Client():
 
 	def _call_delete_api(self, api, parameters, data):
 		delete_url = self.BASE_URL + api + parameters
-		response = requests.delete(delete_url, headers=self.HEADERS, data=data)
+		response = self.session.delete(delete_url, headers=self.HEADERS, data=data, timeout=self.TIMEOUT)
 		# Success is HTTP 204, "No Content"
 		if (response.status_code != 204):
 			#TODO: Real error handling
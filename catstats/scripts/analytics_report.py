@@ -0,0 +1,53 @@
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+
+def _local_name(name):
+    # Strip the {namespace} prefix ElementTree adds to element and attribute names.
+    return name.rpartition("}")[2]
+
+
+def _get_text(elem):
+    # Surrounding whitespace is removed, and empty values are None.
+    return (elem.text or "").strip() or None
+
+
+def parse_report_xml(xml):
+    # Parse one page of an Analytics report (a QueryResult XML document)
+    # incrementally, building row dicts directly from the XML, and discarding
+    # each Row element once it has been read.
+    rows = []
+    column_names = {}
+    is_finished = None
+    resumption_token = None
+    for _, elem in ET.iterparse(BytesIO(xml.encode("utf-8"))):
+        name = _local_name(elem.tag)
+        if name == "Row":
+            # Keys are generic column names: Column0, Column1...
+            rows.append({_local_name(col.tag): _get_text(col) for col in elem})
+            elem.clear()
+        elif name == "element":
+            # Column names are buried in the xsd:schema metadata.
+            # This seems to be available only on initial run (first set of data,
+            # not subsequent ones), even if col_names = true parameter is always
+            # passed to API.
+            attributes = {_local_name(k): v for k, v in elem.attrib.items()}
+            if "columnHeading" in attributes:
+                column_names[attributes["name"]] = attributes["columnHeading"]
+        elif name == "IsFinished":
+            is_finished = _get_text(elem)
+        elif name == "ResumptionToken":
+            resumption_token = _get_text(elem)
+
+    return {
+        "rows": rows,
+        "column_names": column_names,
+        "is_finished": is_finished,  # should always exist
+        "resumption_token": resumption_token,  # may not exist
+    }
+
+
+def get_report_data(report):
+    # Report available only in XML
+    # Entire XML report is a "list" with one value, in 'anies' element of json response
+    return parse_report_xml(report["anies"][0])
@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+# Parser for the 962 fields in an Analytics "Local Param 02" value, shared by
+# refresh_analytics_data and get_catstats_data: it's run for every field loaded.
+# Fields are delimited by ";", and each subfield is "$$<code> <value>".
+
+# 962 subfields, by code, and their field names.
+# Non-repeatable: the first value, or "" if missing.
+NON_REPEATABLE_SUBFIELDS = {
+    "a": "cat_center",
+    "b": "cataloger",
+    "c": "date",
+    "d": "difficulty",
+    "g": "maint_info",
+}
+# Repeatable: a tuple of all values, in order, maybe empty.
+REPEATABLE_SUBFIELDS = {
+    "h": "national_info",
+    "i": "naco_info",
+    "j": "saco_info",
+    "k": "project",
+}
+
+# One parsed 962 field: a tuple, so small and quick to create.
+Field962Data = namedtuple(
+    "Field962Data",
+    [*NON_REPEATABLE_SUBFIELDS.values(), *REPEATABLE_SUBFIELDS.values()],
+)
+
+# Position of each subfield's value in Field962Data
+_INDEXES = {
+    code: index
+    for index, code in enumerate([*NON_REPEATABLE_SUBFIELDS, *REPEATABLE_SUBFIELDS])
+}
+_REPEATABLE_START = len(NON_REPEATABLE_SUBFIELDS)
+# Values of a field with no subfields
+_EMPTY_VALUES = [""] * len(NON_REPEATABLE_SUBFIELDS) + [()] * len(REPEATABLE_SUBFIELDS)
+# Creates a Field962Data from its values, without checking their count.
+_new_tuple = tuple.__new__
+
+
+def parse_962_fields(local_param_02):
+    # Returns a list of Field962Data, one per field.
+    # Raises ValueError if any subfield has no code or value.
+    fields = []
+    get_index = _INDEXES.get
+    for field_text in local_param_02.split(";"):
+        values = _EMPTY_VALUES.copy()
+        # Each subfield in turn, last first, so the first value of
+        # non-repeatable subfields is the one left, and repeatable ones
+        # can be prepended to, keeping them in order.
+        for subfield in field_text.split("$$")[:0:-1]:
+            code, value = subfield.strip().split(" ", 1)
+            index = get_index(code)
+            if index is None:
+                # Other subfields aren't used.
+                continue
+            if index < _REPEATABLE_START:
+                values[index] = value
+            else:
+                values[index] = (value, *values[index])
+        fields.append(_new_tuple(Field962Data, values))
+    return fields
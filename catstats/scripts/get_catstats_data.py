@@ -1,33 +1,14 @@
-import json
 import logging
 import os
 import pprint as pp
 import urllib.parse
-import xmltodict
-from collections import defaultdict
-from copy import deepcopy
+from collections import ChainMap
 from catstats.scripts.alma_api_client import Alma_Api_Client
+from catstats.scripts.analytics_report import get_report_data
+from catstats.scripts.field_962 import parse_962_fields
 
 logger = logging.getLogger(__name__)
 
-def get_real_column_names(report_json):
-	# Column names are buried in metadata
-	# Get dictionary of column info
-	# This seems to be available only on initial run (first set of data, not subsequent ones),
-	# even if col_names = true parameter is always passed to API.
-	column_names = {}
-	try:
-		column_info = report_json['ResultXml']['rowset']['xsd:schema']['xsd:complexType']['xsd:sequence']['xsd:element']
-		# Create mapping of generic column names (Column0 etc.) to real column names
-		for row in column_info:
-			generic_name = row['@name']
-			real_name = row['@saw-sql:columnHeading']
-			column_names[generic_name] = real_name
-	except KeyError:
-		# OK to swallow this error
-		pass
-	return column_names
-
 def get_filter(yyyymm):
 	# By cat center: too slow for RAMS (17+ minutes, 300+ MB data)
 # 	filter_xml = f'''
@@ -75,31 +56,9 @@ def get_filter(yyyymm):
 	# Strip out formatting characters which make API unhappy
 	return filter_xml.replace('\n', '').replace('\t', '')
 
-def get_report_data(report):
-	# Report available only in XML
-	# Entire XML report is a "list" with one value, in 'anies' element of json response
-	xml = report['anies'][0]
-	# Convert xml to python dict intermediate format
-	xml_dict = xmltodict.parse(xml)
-	# Convert this to real json
-	report_json = json.loads(json.dumps(xml_dict))
-	# Everything is in QueryResult dict
-	report_json = report_json['QueryResult']
-	
-	# Actual rows of data are a list of dictionaries, in this dictionary
-	rows = report_json['ResultXml']['rowset']['Row']
-
-	# Clean up
-	report_data = {
-		'rows': rows,
-		'column_names': get_real_column_names(report_json),
-		'is_finished': report_json['IsFinished'], # should always exist
-		'resumption_token': report_json.get('ResumptionToken'), # may not exist
-	}
-
-	return report_data
-
 def run_report(api_key, yyyymm):
+	# Generator yielding rows one page at a time, with real column names,
+	# so rows can be filtered as they arrive instead of all being held at once.
 	alma = Alma_Api_Client(api_key)
 	report_path = '/shared/University of California Los Angeles (UCLA) 01UCS_LAL/Cataloging/Reports/API/Cataloging Statistics (API)'
 	# From form
@@ -118,7 +77,6 @@ def run_report(api_key, yyyymm):
 	# First run: use constant + initial parameters merged
 	report = alma.get_analytics_report(constant_params | initial_params)
 	report_data = get_report_data(report)
-	all_rows = report_data['rows']
 	# Preserve column_names as they don't seem to be set on subsequent runs
 	column_names = report_data['column_names']
 
@@ -127,80 +85,70 @@ def run_report(api_key, yyyymm):
 		'token': report_data['resumption_token'],
 	}
 
-	while report_data['is_finished'] == 'false':
+	while True:
+		# Update keys to use real column names, removing meaningless Column0
+		for row in report_data['rows']:
+			yield {column_names.get(k): v for k, v in row.items() if k != 'Column0'}
+		if report_data['is_finished'] != 'false':
+			break
 		# After first run: use constant = subsequent parameters merged
 		report = alma.get_analytics_report(constant_params | subsequent_params)
 		report_data = get_report_data(report)
-		all_rows.extend(report_data['rows'])
-
-	return {'column_names': column_names, 'rows': all_rows}
 
-def row_is_wanted(row, filters):
-	# Compare row values to filters.  If any filter fails, row is not wanted.
+def bib_is_wanted(row, filters):
+	# Checks which don't need the 962 fields parsed, so unwanted bibs can be
+	# skipped before parsing them.
+	# Non-962 filters
+	if filters['language_code'] != '' and filters['language_code'] != row['Language Code']:
+		return False
+	# Every wanted field has the cat center in $a and the yyyymm in $c,
+	# so both must be somewhere in Local Param 02.
+	local_param_02 = row['Local Param 02']
+	return filters['cat_center'] in local_param_02 and filters['year'] + filters['month'] in local_param_02
+
+def field_is_wanted(f962, filters):
+	# Compare 962 field values to filters.  If any filter fails, field is not wanted.
 	# Filter values all exist, and strings will be '' if filter is not set.
+	# f962 is a Field962Data: missing subfields are '', or () if repeatable
 	is_wanted = True
-	# Dictionary of lists: code: [val1,...]
-	f962 = row['F962']
 	# Cataloging center in $a: Filter is always a non-empty string
-	if filters['cat_center'] not in f962.get('a', ''):
+	if filters['cat_center'] not in f962.cat_center:
 		is_wanted = False
 	# Cataloger initials in $b: Filter may be an empty string
-	elif filters['cataloger'] != '' and filters['cataloger'] not in f962.get('b', '').lower():
+	elif filters['cataloger'] != '' and filters['cataloger'] not in f962.cataloger.lower():
 		is_wanted = False
 	# Date in $c is yyyymmdd: Filter is always a non-empty string, yyyymm
-	# Still unclear if we need to support multiple $d per 962 field.
-	# elif filters['year'] + filters['month'] != f962.get('c', '')[0][0:6]:  # IF USING DICT OF LISTS
-	elif filters['year'] + filters['month'] != f962.get('c', '')[0:6]:
+	elif filters['year'] + filters['month'] != f962.date[0:6]:
 		is_wanted = False
 	# Difficulty in $d is required: Do not approve rows missing it
-	elif f962.get('d') is None:
+	elif f962.difficulty == '':
 		is_wanted = False
-	# Local value in $k: $k may not exist, and filter may be an empty string
-	elif filters['f962_k_code'] != '' and filters['f962_k_code'] not in f962.get('k', ''):
-		is_wanted = False
-	# Non-962 filters
-	elif filters['language_code'] != '' and filters['language_code'] != row['Language Code']:
+	# Local value in $k (repeatable): $k may not exist, and filter may be an empty string
+	elif filters['f962_k_code'] != '' and not any(filters['f962_k_code'] in k for k in f962.project):
 		is_wanted = False
 
 	return is_wanted
 
-def expand_and_filter_data(report_data, filters=None):
-	# Analytics data has 1 row per bib record;
-	# multiple 962 fields are combined in ...
-	data = []
-	column_names = report_data['column_names']
-	rows = report_data['rows']
+def expand_and_filter_data(rows, filters):
+	# Analytics data has 1 row per bib record, with
+	# multiple 962 fields combined in Local Param 02.
+	# Generator yielding one row per wanted 962 field, filtering as rows
+	# arrive from run_report().  Each is the field, as F962, in front of its
+	# bib's row: bib values are shared by reference, not copied per field.
 	for row in rows:
-		# Update keys to use real column names, removing meaningless Column0
-		row = dict([(column_names.get(k), v) for k, v in row.items() if k != 'Column0'])
-		# Split rows where Local Param 02 contains multiple 962 fields, delimited by ';'
-		fld_962s = row['Local Param 02'].split(';')
-		for fld_962 in fld_962s:
-			new_row = deepcopy(row)
-			r = fld_962.strip()
-
-			# Creates dict of lists, which is a pain
-			# sfd_dict = defaultdict(list)
-			# for subfield in r.split('$$')[1:]:
-			# 	code, value = subfield.strip().split(' ', 1)
-			# 	sfd_dict[code].append(value)
-
-			# Creates dictionary: OK except when subfields are repeated, only last value is kept.
-			sfd_dict = {code: value for sfd in fld_962.split('$$')[1:] for code, value in [sfd.strip().split(' ', 1)]}
-			new_row['F962'] = sfd_dict
-
-			if row_is_wanted(new_row, filters):
-				data.append(new_row)
-
-	return data
+		if not bib_is_wanted(row, filters):
+			continue
+		# Parsed the same way as when loading the database
+		for fld_962 in parse_962_fields(row['Local Param 02']):
+			if field_is_wanted(fld_962, filters):
+				yield ChainMap({'F962': fld_962}, row)
 
 def main(filters):
 	api_key = os.getenv('ALMA_API_KEY')
 	logger.info(f'{filters = }')
 	yyyymm = filters['year'] + filters['month']
-	report_data = run_report(api_key, yyyymm)
-	logger.info(f'Data rows retrieved: {len(report_data["rows"]) = }')
-	data = expand_and_filter_data(report_data, filters)
+	# Only wanted rows are ever held, as rows are filtered as they're fetched.
+	data = list(expand_and_filter_data(run_report(api_key, yyyymm), filters))
 	logger.info(f'Data rows after expand/filter: {len(data) = }')
 	return data
 
@@ -1,19 +1,21 @@
+from collections import Counter
+
 # Convert report data to cross-tab compatible
 def get_crosstab_data(report_data, difficulties):
 	# Get counts by format for each cataloging difficulty in difficulties, including totals.
 	# Returns ordered list of lists for easy output in HTML template.
+	# report_data can be any iterable of rows, including the
+	# expand_and_filter_data() generator: it's read only once.
 
-	# List of (resource type, difficulty) for rows having one of the desired difficulties.
-	# Still unclear if we need to support multiple $d per 962 field.
-	# IF USING DICT OF LISTS......
-	#vals = [(r['Resource Type'], r['F962']['d'][0]) for r in report_data if r['F962']['d'][0] in difficulties]
-	# IF USING REGULAR DICTIONARY.......
-	vals = [(r['Resource Type'], r['F962']['d']) for r in report_data if r['F962']['d'] in difficulties]
-	# Dictionary of tuple: count from vals
-	counts = {val:vals.count(val) for val in vals}
+	# Count of each (resource type, difficulty) for rows having one of the desired difficulties,
+	# in a single pass.
+	# $d is non-repeatable, so Field962Data has just the first.
+	counts = Counter(
+		(r['Resource Type'], r['F962'].difficulty) for r in report_data if r['F962'].difficulty in difficulties
+	)
 	# Only values which are used
-	formats = sorted(set([val[0] for val in vals]))
-	diffs = sorted(set([val[1] for val in vals]))
+	formats = sorted(set([val[0] for val in counts]))
+	diffs = sorted(set([val[1] for val in counts]))
 
 	data_dict = { format: [counts.get((format, diff), 0) for diff in diffs] for format in formats}
 	# Add totals
@@ -0,0 +1,122 @@
+# Synthetic Analytics report rows, for loading realistic amounts of data
+# into a development database and benchmarking; see the generate_catstats_data
+# and benchmark_reports commands.
+# Rows look like run_report() output, so they go through the normal load path.
+import random
+from datetime import datetime as dt
+from catstats.forms import CAT_CENTERS
+from catstats.view_utils import get_difficulties
+
+# Roughly how often 962 subfields occur, and how many values they have
+# when they do: (chance of occurring, largest number of values)
+SUBFIELD_RATES = {
+    "g": (0.2, 1),
+    "h": (0.3, 2),
+    "i": (0.2, 2),
+    "j": (0.05, 1),
+    "k": (0.1, 2),
+}
+
+RESOURCE_TYPES = [
+    "Book - Physical",
+    "Book - Electronic",
+    "Music Score - Physical",
+    "Video - Physical",
+    "Journal - Physical",
+    "Map - Physical",
+    "Sound Recording - Physical",
+]
+LANGUAGE_CODES = ["eng", "spa", "chi", "jpn", "fre", "ger", "kor", "rus", "ara", "ita"]
+PLACE_CODES = ["cau", "nyu", "enk", "ch", "ja", "fr", "gw", "mx", "ko", "ru"]
+NATIONAL_INFO = ["pcc", "lc", "nlm", "dlc", "conser"]
+NACO_INFO = ["naco", "naco update", "nacoi", "saco", "saco update"]
+
+
+def zipf_weights(count, exponent=1.0):
+    # Weights for count choices, where the first is most common and each
+    # later one less so: how catalogers, centers, projects etc. are spread.
+    return [1 / rank**exponent for rank in range(1, count + 1)]
+
+
+class SyntheticData:
+    # Generates rows reproducibly for a given seed.
+    def __init__(
+        self,
+        seed=0,
+        max_fields=4,
+        catalogers_per_center=40,
+        projects=25,
+        months=None,
+    ):
+        # months: YYYYMM values for 962 $c dates (default: every month since 2007)
+        self.random = random.Random(seed)
+        self.field_counts = list(range(1, max_fields + 1))
+        self.cat_centers = [code for code, _ in CAT_CENTERS if code != "ALL"]
+        # RAMS first, as by far the busiest
+        self.cat_centers.sort(key=lambda code: code != "rams")
+        self.catalogers = [f"cat{n:03}" for n in range(catalogers_per_center)]
+        self.projects = [f"proj{n}" for n in range(1, projects + 1)]
+        self.new_difficulties = get_difficulties("01")
+        self.maint_difficulties = get_difficulties("04")
+        current = dt.now()
+        self.months = months or [
+            f"{year}{month:02}"
+            for year in range(2007, current.year + 1)
+            for month in range(1, 13)
+            if (year, month) <= (current.year, current.month)
+        ]
+
+    def choose(self, values, exponent=1.0):
+        return self.random.choices(values, zipf_weights(len(values), exponent))[0]
+
+    def get_subfield_values(self, code):
+        chance, max_values = SUBFIELD_RATES[code]
+        if self.random.random() >= chance:
+            return []
+        value_count = self.random.randint(1, max_values)
+        if code == "g":
+            values = [f"m{self.random.randint(1, 9)}" for _ in range(value_count)]
+        elif code == "h":
+            values = [self.choose(NATIONAL_INFO) for _ in range(value_count)]
+        elif code in ["i", "j"]:
+            values = [self.choose(NACO_INFO) for _ in range(value_count)]
+        else:
+            values = [self.choose(self.projects) for _ in range(value_count)]
+        # Repeated values are allowed, but rare in real data.
+        return sorted(set(values))
+
+    def get_field_962(self):
+        yyyymm = self.random.choice(self.months)
+        if self.random.random() < 0.7:
+            difficulty = self.random.choice(self.new_difficulties)
+        else:
+            difficulty = self.random.choice(self.maint_difficulties)
+        subfields = [
+            ("a", self.choose(self.cat_centers, exponent=1.5)),
+            ("b", self.choose(self.catalogers)),
+            ("c", f"{yyyymm}{self.random.randint(1, 28):02}"),
+            ("d", difficulty),
+        ]
+        for code in SUBFIELD_RATES:
+            subfields.extend((code, value) for value in self.get_subfield_values(code))
+        return " ".join(f"$${code} {value}" for code, value in subfields)
+
+    def get_row(self, mmsid):
+        # Most bibs have one 962 field; with 4 at most, about 70% have 1,
+        # 18% 2, 8% 3 and 4% 4.
+        field_count = self.choose(self.field_counts, exponent=2)
+        return {
+            "MMS Id": mmsid,
+            "Language Code": self.choose(LANGUAGE_CODES, exponent=2),
+            "Place Code": self.choose(PLACE_CODES, exponent=2),
+            "Material Type": "Book",
+            "Resource Type": self.choose(RESOURCE_TYPES, exponent=1.5),
+            "962 - Local Param 02": "; ".join(
+                self.get_field_962() for _ in range(field_count)
+            ),
+        }
+
+    def get_rows(self, bib_count, first_mmsid=9900000000000000):
+        # Generator, so any number of rows can be loaded in batches.
+        for number in range(bib_count):
+            yield self.get_row(str(first_mmsid + number))
@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import json
+import os
+import socket
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from catstats.analytics_server import make_server
+from catstats.management.commands.refresh_analytics_data import (
+    CopyLoader,
+    add_data_to_db,
+    get_incremental_months,
+    get_months,
+    load_years,
+    refresh_all_data,
+    refresh_incremental_data,
+    refresh_month,
+    run_report,
+)
+from catstats.forms import REPORTS
+from catstats.jobs import (
+    claim_next_job,
+    enqueue_load,
+    run_queued_jobs,
+    send_heartbeats,
+)
+from catstats.models import (
+    BibRecord,
+    Field962,
+    Field962Rollup,
+    LoadJob,
+    LoadRun,
+    LoadState,
+    RepeatableSubfield,
+    ReportTiming,
+    SubfieldRollup,
+)
+from catstats.partitions import ensure_partitions
+from catstats.reports import (
+    REPORT_SPECS,
+    SUBFIELDS,
+    SUMMARY,
+    ReportSpec,
+    bump_data_version,
+    get_data_version,
+    get_report,
+    get_timing_summary,
+    percentile,
+    warm_report_cache,
+)
+from catstats.rollups import rebuild_rollups
+from catstats.scripts.alma_api_client import Alma_Api_Client
+from catstats.scripts.analytics_report import get_report_data, parse_report_xml
+from catstats.scripts.field_962 import Field962Data, parse_962_fields
+from catstats.scripts.get_catstats_data import expand_and_filter_data
+from catstats.scripts.get_crosstab_data import (
+    get_crosstab_data as get_live_crosstab_data,
+)
+from catstats.synthetic_data import SyntheticData
+from catstats.view_utils import (
+    filter_log_lines,
+    get_crosstab_data,
+    get_report_filters,
+    get_summary_data,
+    read_log_chunk,
+)
 
-# Create your tests here.
+
+def create_bib(mmsid, resource_type, fields_962):
+    # Create a bib with one Field962 per dict in fields_962.
+    bib = BibRecord.objects.create(
+        mmsid=mmsid,
+        language_code="eng",
+        place_code="cau",
+        material_type="Book",
+        resource_type=resource_type,
+    )
+    for fld in fields_962:
+        Field962.objects.create(
+            bib_record=bib,
+            cat_center=fld.get("cat_center", "rams"),
+            cataloger=fld.get("cataloger", "abc"),
+            yyyymm=fld.get("yyyymm", "202401"),
+            difficulty=fld.get("difficulty", "1"),
+            maint_info=fld.get("maint_info", ""),
+        )
+    return bib
+
+
+class CrosstabTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_bib("1", "Book", [{"difficulty": "1"}, {"difficulty": "2"}])
+        create_bib("2", "Book", [{"difficulty": "1"}])
+        create_bib("3", "Score", [{"difficulty": "3+"}])
+
+    def get_report_data(self):
+        return Field962.objects.values(
+            "difficulty", format=F("bib_record__resource_type")
+        ).annotate(count=Count("id"))
+
+    def test_crosstab_uses_one_query(self):
+        with self.assertNumQueries(1):
+            get_crosstab_data(self.get_report_data(), "format", "difficulty")
+
+    def test_crosstab_layout(self):
+        headers, data_rows = get_crosstab_data(
+            self.get_report_data(), "format", "difficulty"
+        )
+        self.assertEqual(headers, ["Format", "1", "2", "3+", "Total"])
+        self.assertEqual(
+            data_rows,
+            [
+                ["Book", 2, 1, 0, 3],
+                ["Score", 0, 0, 1, 1],
+                ["Totals", 2, 1, 1, 4],
+            ],
+        )
+
+    def test_crosstab_no_data(self):
+        headers, data_rows = get_crosstab_data(
+            self.get_report_data().filter(yyyymm="199901"), "format", "difficulty"
+        )
+        self.assertEqual(headers, ["Format", "Total"])
+        self.assertEqual(data_rows, [[]])
+
+
+class SummaryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_bib("1", "Book", [{"maint_info": "b"}, {"maint_info": "a"}])
+        create_bib("2", "Book", [{"maint_info": "b"}, {"maint_info": ""}])
+
+    def test_summary_is_grouped_in_database(self):
+        report_data = Field962.objects.filter(maint_info__gt="")
+        with self.assertNumQueries(1):
+            data_rows = get_summary_data(report_data, "maint_info")
+        self.assertEqual(data_rows, [["a", 1], ["b", 2], ["Totals", 3]])
+
+    def test_summary_no_data(self):
+        report_data = Field962.objects.filter(yyyymm="199901")
+        self.assertEqual(get_summary_data(report_data, "maint_info"), [[]])
+
+
+def get_analytics_row(mmsid, local_param_02, resource_type="Book"):
+    # Row as returned by run_report(), after column renaming.
+    return {
+        "MMS Id": mmsid,
+        "Language Code": "eng",
+        "Place Code": "cau",
+        "Material Type": "Book",
+        "Resource Type": resource_type,
+        "962 - Local Param 02": local_param_02,
+    }
+
+
+class AddDataToDbTestCase(TestCase):
+    def test_bibs_fields_and_subfields_are_loaded(self):
+        add_data_to_db(
+            [
+                get_analytics_row(
+                    "991",
+                    "$$a rams $$b abc $$c 20240115 $$d 1 $$h pcc $$k proj1 $$k proj2;"
+                    " $$a eal $$b def $$c 20240201 $$d 2+",
+                ),
+                get_analytics_row("992", "$$a clk $$b ghi $$c 20240120 $$d 3"),
+            ]
+        )
+        self.assertEqual(BibRecord.objects.count(), 2)
+        self.assertEqual(Field962.objects.filter(bib_record__mmsid="991").count(), 2)
+        fld = Field962.objects.get(bib_record__mmsid="991", cat_center="rams")
+        self.assertEqual(fld.yyyymm, "202401")
+        self.assertEqual(
+            set(fld.repeatablesubfield_set.values_list("yyyymm", flat=True)),
+            {"202401"},
+        )
+        self.assertEqual(
+            sorted(
+                fld.repeatablesubfield_set.values_list(
+                    "subfield_code", "subfield_value"
+                )
+            ),
+            [("h", "pcc"), ("k", "proj1"), ("k", "proj2")],
+        )
+
+    def test_existing_bibs_are_replaced(self):
+        add_data_to_db([get_analytics_row("991", "$$a rams $$c 20240115 $$d 1")])
+        add_data_to_db(
+            [get_analytics_row("991", "$$a rams $$c 20240115 $$d 2 $$h pcc")]
+        )
+        self.assertEqual(BibRecord.objects.count(), 1)
+        self.assertEqual(Field962.objects.get().difficulty, "2")
+        self.assertEqual(RepeatableSubfield.objects.count(), 1)
+
+    def test_unparseable_rows_are_skipped(self):
+        add_data_to_db(
+            [
+                get_analytics_row("991", "$$a rams $$c 20240115 $$d"),
+                get_analytics_row("992", "$$a rams $$c 20240115 $$d 1"),
+            ]
+        )
+        self.assertEqual(
+            list(BibRecord.objects.values_list("mmsid", flat=True)), ["992"]
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning requires PostgreSQL")
+class PartitionTestCase(TestCase):
+    def get_partitions(self, model):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT tableoid::regclass::text FROM {model._meta.db_table}"
+            )
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def test_rows_are_routed_to_yearly_partitions(self):
+        add_data_to_db(
+            [
+                get_analytics_row(
+                    "991", "$$a rams $$c 20240115 $$d 1 $$h pcc; $$a rams $$c 20230601"
+                )
+            ]
+        )
+        self.assertEqual(
+            self.get_partitions(Field962),
+            ["catstats_field962_2023", "catstats_field962_2024"],
+        )
+        self.assertEqual(
+            self.get_partitions(RepeatableSubfield),
+            ["catstats_repeatablesubfield_2024"],
+        )
+
+    def test_new_partition_takes_rows_from_default(self):
+        add_data_to_db([get_analytics_row("991", "$$a rams $$c 21000115 $$h pcc")])
+        self.assertEqual(self.get_partitions(Field962), ["catstats_field962_default"])
+        ensure_partitions([2100])
+        self.assertEqual(self.get_partitions(Field962), ["catstats_field962_2100"])
+        self.assertEqual(
+            self.get_partitions(RepeatableSubfield),
+            ["catstats_repeatablesubfield_2100"],
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY requires PostgreSQL")
+class CopyLoaderTestCase(TransactionTestCase):
+    # Each batch is committed, as in a real load: TRUNCATE and CREATE INDEX
+    # fail on tables with foreign key checks still pending.
+    def get_index_names(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table
+            )
+        return {name for name, info in constraints.items() if info["index"]}
+
+    def assertIndexesExist(self):
+        for model in CopyLoader.indexed_models:
+            for index in model._meta.indexes:
+                self.assertIn(index.name, self.get_index_names(model))
+
+    def load(self, *reports, drop_indexes=False):
+        loader = CopyLoader(drop_indexes)
+        try:
+            loader.start()
+            for report_data in reports:
+                loader.load(report_data)
+        finally:
+            loader.finish()
+
+    def get_ids(self, model):
+        return list(model.objects.order_by("pk").values_list("pk", flat=True))
+
+    def test_ids_are_contiguous_and_sequences_continue(self):
+        add_data_to_db([get_analytics_row("990", "$$a rams $$c 20240115 $$h pcc")])
+        self.load(
+            [
+                get_analytics_row(
+                    "991", "$$a rams $$c 20240115 $$h pcc $$k p1; $$a eal $$c 20230601"
+                ),
+                get_analytics_row("992", "$$a rams $$c 20240201 $$i naco"),
+            ]
+        )
+        self.assertEqual(self.get_ids(BibRecord), [1, 2])
+        self.assertEqual(self.get_ids(Field962), [1, 2, 3])
+        self.assertEqual(self.get_ids(RepeatableSubfield), [1, 2, 3])
+        add_data_to_db([get_analytics_row("993", "$$a rams $$c 20240301 $$h pcc")])
+        self.assertEqual(self.get_ids(BibRecord), [1, 2, 3])
+        self.assertEqual(self.get_ids(Field962), [1, 2, 3, 4])
+        self.assertEqual(self.get_ids(RepeatableSubfield), [1, 2, 3, 4])
+
+    def test_bib_in_two_years_is_loaded_once(self):
+        row = get_analytics_row("991", "$$a rams $$c 20240115; $$a rams $$c 20230601")
+        self.load([row], [row])
+        self.assertEqual(BibRecord.objects.count(), 1)
+        self.assertEqual(Field962.objects.count(), 2)
+
+    def test_dropped_indexes_are_restored(self):
+        self.load(
+            [get_analytics_row("991", "$$a rams $$c 20240115 $$h pcc")],
+            drop_indexes=True,
+        )
+        self.assertIndexesExist()
+        self.assertEqual(Field962.objects.count(), 1)
+
+    def test_dropped_indexes_are_restored_after_load_fails(self):
+        with mock.patch(
+            "catstats.management.commands.refresh_analytics_data.load_years",
+            side_effect=RuntimeError("load failed"),
+        ):
+            with self.assertRaises(RuntimeError):
+                refresh_all_data(fast_load=True, drop_indexes=True)
+        self.assertIndexesExist()
+
+    def test_dropped_indexes_are_restored_after_start_fails(self):
+        remove_index = connection.SchemaEditorClass.remove_index
+        removed = []
+
+        def remove_one_index(editor, model, index):
+            # Drops the first index, then fails.
+            if removed:
+                raise RuntimeError("drop failed")
+            remove_index(editor, model, index)
+            removed.append(index.name)
+
+        with mock.patch.object(
+            connection.SchemaEditorClass, "remove_index", remove_one_index
+        ):
+            with self.assertRaises(RuntimeError):
+                self.load([], drop_indexes=True)
+        self.assertEqual(len(removed), 1)
+        self.assertIndexesExist()
+
+
+class LoadYearsTestCase(TestCase):
+    def test_years_are_retried_three_times(self):
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                calls = []
+
+                def fake_run_report(year):
+                    calls.append(year)
+                    # 2020 always fails, 2021 fails once.
+                    if year == 2020 or calls.count(year) == 1 and year == 2021:
+                        raise ConnectionError("Analytics unavailable")
+                    return [year]
+
+                loaded = []
+                with mock.patch(
+                    "catstats.management.commands.refresh_analytics_data.run_report",
+                    fake_run_report,
+                ):
+                    load_years([2022, 2021, 2020], loaded.extend, workers=workers)
+                self.assertEqual(sorted(loaded), [2021, 2022])
+                self.assertEqual(calls.count(2020), 3)
+                self.assertEqual(calls.count(2021), 2)
+                self.assertEqual(calls.count(2022), 1)
+
+    @mock.patch(
+        "catstats.management.commands.refresh_analytics_data.LOAD_BATCH_SIZE", 5
+    )
+    def test_years_are_fetched_in_batches(self):
+        # 100 rows per year, counting rows fetched but not yet loaded
+        fetched = []
+        loaded = []
+        waiting = []
+
+        def fake_run_report(year):
+            for number in range(100):
+                fetched.append(year)
+                yield (year, number)
+
+        def load_batch(batch):
+            loaded.extend(batch)
+            # 2021 fails once, partway through, leaving rows fetched
+            # but never loaded.
+            if batch[0] == (2021, 50) and loaded.count((2021, 50)) == 1:
+                raise ConnectionError("Database unavailable")
+            if (2021, 50) not in loaded:
+                waiting.append(len(fetched) - len(loaded))
+
+        with mock.patch(
+            "catstats.management.commands.refresh_analytics_data.run_report",
+            fake_run_report,
+        ):
+            failed_years = load_years([2022, 2021, 2020], load_batch, workers=2)
+        self.assertEqual(failed_years, [])
+        self.assertEqual(
+            set(loaded), {(year, n) for year in [2020, 2021, 2022] for n in range(100)}
+        )
+        # A batch per worker waiting in the queue, and one each being put
+        # there, not whole years.
+        self.assertLessEqual(max(waiting), 2 * 2 * 5 + 2)
+
+
+class LoadJobTestCase(TestCase):
+    def test_loads_are_deduplicated_by_yyyymm(self):
+        job, created = enqueue_load("202401")
+        self.assertTrue(created)
+        self.assertEqual(enqueue_load("202401"), (job, False))
+        self.assertTrue(enqueue_load("202402")[1])
+        job.status = LoadJob.Status.DONE
+        job.save()
+        self.assertTrue(enqueue_load("202401")[1])
+
+    def test_one_job_runs_at_a_time(self):
+        first_job, _ = enqueue_load("202401")
+        second_job, _ = enqueue_load("202402")
+        self.assertEqual(claim_next_job(), first_job)
+        self.assertIsNone(claim_next_job())
+        first_job.refresh_from_db()
+        self.assertEqual(first_job.status, LoadJob.Status.RUNNING)
+
+    def start_job(self, yyyymm, started_at, heartbeat_at, hostname, pid):
+        return LoadJob.objects.create(
+            yyyymm=yyyymm,
+            status=LoadJob.Status.RUNNING,
+            started_at=started_at,
+            heartbeat_at=heartbeat_at,
+            hostname=hostname,
+            pid=pid,
+        )
+
+    def test_jobs_without_heartbeats_are_abandoned(self):
+        now = timezone.now()
+        # Long-running, but still alive elsewhere
+        running_job = self.start_job(
+            "ALL", now - timedelta(hours=20), now - timedelta(seconds=30), "other", 1
+        )
+        queued_job, _ = enqueue_load("202401")
+        self.assertIsNone(claim_next_job())
+        # Missed heartbeats
+        running_job.heartbeat_at = now - timedelta(minutes=10)
+        running_job.save()
+        self.assertEqual(claim_next_job(), queued_job)
+        running_job.refresh_from_db()
+        self.assertEqual(
+            (running_job.status, running_job.error),
+            (LoadJob.Status.FAILED, "Abandoned"),
+        )
+        queued_job.refresh_from_db()
+        self.assertEqual(
+            (queued_job.hostname, queued_job.pid),
+            (socket.gethostname(), os.getpid()),
+        )
+
+    def test_jobs_of_dead_processes_are_abandoned(self):
+        now = timezone.now()
+        self.start_job("ALL", now, now, socket.gethostname(), 2**22 + 1)
+        queued_job, _ = enqueue_load("202401")
+        with mock.patch("catstats.jobs.os.kill", side_effect=ProcessLookupError):
+            self.assertEqual(claim_next_job(), queued_job)
+
+    @mock.patch("catstats.jobs.connections")
+    def test_heartbeats(self, mock_connections):
+        job = self.start_job("ALL", timezone.now(), None, "", None)
+        stop = mock.Mock(**{"wait.side_effect": [False, True]})
+        send_heartbeats(job, stop)
+        job.refresh_from_db()
+        self.assertIsNotNone(job.heartbeat_at)
+
+    @mock.patch("catstats.jobs.call_command")
+    def test_queued_jobs_are_run(self, mock_call_command):
+        def load_month(command, yyyymm, load_job):
+            # Loaded by another refresh at the same time: not counted
+            LoadState.objects.create(
+                yyyymm=f"2023{yyyymm[4:]}",
+                status=LoadState.Status.LOADED,
+                row_count=100,
+                loaded_at=timezone.now(),
+            )
+            if yyyymm == "202402":
+                raise ValueError("Analytics is down")
+            run = LoadRun.objects.create(yyyymm=yyyymm, rows_loaded=5)
+            LoadJob.objects.filter(pk=load_job).update(load_run=run)
+
+        mock_call_command.side_effect = load_month
+        enqueue_load("202401")
+        enqueue_load("202402")
+        run_queued_jobs()
+        self.assertEqual(
+            list(
+                LoadJob.objects.order_by("id").values_list(
+                    "yyyymm", "status", "rows_loaded", "error"
+                )
+            ),
+            [
+                ("202401", "done", 5, ""),
+                ("202402", "failed", 0, "Analytics is down"),
+            ],
+        )
+
+    @mock.patch("catstats.jobs.call_command")
+    def test_worker_command_runs_queued_jobs(self, mock_call_command):
+        job, _ = enqueue_load("202401")
+        call_command("run_load_worker", once=True)
+        mock_call_command.assert_called_once_with(
+            "refresh_analytics_data", yyyymm="202401", load_job=job.id
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.status, LoadJob.Status.DONE)
+
+    @mock.patch("catstats.jobs.call_command")
+    def test_load_data_view(self, mock_call_command):
+        response = self.client.get("/load_data", {"yyyymm": "202401"})
+        self.assertContains(response, "Queued data load for 202401")
+        # Loads run only in run_load_worker.
+        mock_call_command.assert_not_called()
+        response = self.client.get("/load_data", {"yyyymm": "202401"})
+        self.assertContains(response, "Data for 202401 is already queued")
+        response = self.client.get("/load_data", {"yyyymm": "2024; rm -rf /"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(LoadJob.objects.count(), 1)
+
+    def test_load_status_view(self):
+        job, _ = enqueue_load("ALL")
+        response = self.client.get("/load_status", {"id": job.id})
+        self.assertEqual(
+            [
+                (job["yyyymm"], job["status"], job["duration"])
+                for job in response.json()["jobs"]
+            ],
+            [("ALL", "queued", None)],
+        )
+
+
+class SyntheticDataTestCase(TestCase):
+    def test_generated_data_is_repeatable(self):
+        rows = list(SyntheticData(seed=1).get_rows(50))
+        self.assertEqual(rows, list(SyntheticData(seed=1).get_rows(50)))
+        call_command("generate_catstats_data", bibs=50, seed=1)
+        self.assertEqual(BibRecord.objects.count(), 50)
+        self.assertGreaterEqual(Field962.objects.count(), 50)
+        self.assertTrue(Field962Rollup.objects.exists())
+
+    def test_benchmark_results(self):
+        call_command("generate_catstats_data", bibs=50)
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        output_file = os.path.join(output_dir.name, "results.json")
+        call_command(
+            "benchmark_reports",
+            repeat=1,
+            load_bibs=10,
+            output=output_file,
+            stdout=StringIO(),
+        )
+        with open(output_file) as f:
+            results = json.load(f)
+        self.assertEqual(results["bib_count"], 50)
+        self.assertEqual(
+            {result["report"] for result in results["reports"]},
+            {code for code, _ in REPORTS},
+        )
+        self.assertEqual(results["load"]["bibs"], 10)
+        # Loaded bibs are rolled back.
+        self.assertEqual(BibRecord.objects.count(), 50)
+
+
+class ViewLogsTestCase(TestCase):
+    def setUp(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        self.log_file = os.path.join(log_dir.name, "application.log")
+        with open(self.log_file, "w") as f:
+            f.write(
+                "INFO 2024-01-01 first\n"
+                "ERROR 2024-01-02 failed <badly>\n"
+                "Traceback (most recent call last):\n"
+                "INFO 2024-01-03 last\n"
+            )
+
+    def test_log_is_read_from_the_end(self):
+        lines, start, end, file_size = read_log_chunk(self.log_file, size=30)
+        # The partial line before the last 30 bytes is skipped.
+        self.assertEqual(lines, ["INFO 2024-01-03 last"])
+        self.assertEqual((end, file_size), (110, 110))
+        lines, *_ = read_log_chunk(self.log_file, end=start, size=70)
+        self.assertEqual(
+            lines,
+            ["ERROR 2024-01-02 failed <badly>", "Traceback (most recent call last):"],
+        )
+
+    def test_pages_older_then_newer(self):
+        expected = [f"INFO line{n} " + "x" * (n % 7) for n in range(40)]
+        with open(self.log_file, "w") as f:
+            f.write("".join(f"{line}\n" for line in expected))
+        # Older pages, from the end back to the start of the file
+        pages = []
+        lines, start, end, file_size = read_log_chunk(self.log_file, size=50)
+        pages.insert(0, lines)
+        while start > 0:
+            lines, start, _, _ = read_log_chunk(self.log_file, end=start, size=50)
+            pages.insert(0, lines)
+        self.assertEqual([line for page in pages for line in page], expected)
+        # Newer pages, from a page in the middle to the end of the file
+        lines, start, end, _ = read_log_chunk(self.log_file, end=300, size=50)
+        seen = list(lines)
+        while end < file_size:
+            lines, page_start, end, _ = read_log_chunk(
+                self.log_file, size=50, start=end
+            )
+            # Whole lines only, never cut off at either end
+            self.assertTrue(all(line in expected for line in lines))
+            seen.extend(lines)
+        self.assertEqual(seen, expected[expected.index(seen[0]) :])
+
+    def test_view_logs_newer_link(self):
+        with mock.patch("catstats.views.LOG_FILE", self.log_file):
+            response = self.client.get("/view_logs", {"end": "30", "kb": "1"})
+            content = b"".join(response.streaming_content).decode("utf-8")
+            self.assertIn("kb=1&amp;start=22", content)
+            response = self.client.get("/view_logs", {"start": "22", "kb": "1"})
+            content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertNotIn("first", content)
+        self.assertIn("INFO 2024-01-03 last", content)
+
+    def test_log_lines_are_filtered(self):
+        lines, *_ = read_log_chunk(self.log_file)
+        self.assertEqual(
+            list(filter_log_lines(lines, level="WARNING")),
+            ["ERROR 2024-01-02 failed <badly>", "Traceback (most recent call last):"],
+        )
+        self.assertEqual(
+            list(filter_log_lines(lines, keyword="LAST")),
+            ["Traceback (most recent call last):", "INFO 2024-01-03 last"],
+        )
+
+    def test_view_logs(self):
+        with mock.patch("catstats.views.LOG_FILE", self.log_file):
+            response = self.client.get("/view_logs", {"level": "ERROR", "kb": "1"})
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertIn("failed &lt;badly&gt;", content)
+        self.assertNotIn("first", content)
+
+
+class RunReportTestCase(TestCase):
+    def test_rows_are_streamed_across_pages(self):
+        pages = [
+            {
+                "rows": [{"Column0": "0", "Column1": "991"}],
+                "column_names": {"Column0": "0", "Column1": "MMS Id"},
+                "is_finished": "false",
+                "resumption_token": "ABC123",
+            },
+            {
+                "rows": [{"Column0": "0", "Column1": "992"}],
+                "column_names": {},
+                "is_finished": "false",
+                "resumption_token": None,
+            },
+            {
+                "rows": [{"Column0": "0", "Column1": "993"}],
+                "column_names": {},
+                "is_finished": "true",
+                "resumption_token": None,
+            },
+        ]
+        fetched = []
+
+        def fake_fetch_report_page(alma, parameters):
+            fetched.append(parameters)
+            return pages[len(fetched) - 1]
+
+        with mock.patch(
+            "catstats.management.commands.refresh_analytics_data.fetch_report_page",
+            fake_fetch_report_page,
+        ):
+            rows = run_report("202401")
+            # Nothing is fetched until the generator is consumed.
+            self.assertEqual(fetched, [])
+            self.assertEqual(
+                list(rows), [{"MMS Id": "991"}, {"MMS Id": "992"}, {"MMS Id": "993"}]
+            )
+        self.assertEqual(len(fetched), 3)
+        self.assertEqual(fetched[1]["token"], "ABC123")
+        self.assertEqual(fetched[2]["token"], "ABC123")
+
+
+# One page of Analytics report data, trimmed to 3 columns and 2 rows.
+REPORT_PAGE_XML = (
+    '<QueryResult xmlns="urn:schemas-microsoft-com:xml-analysis:rowset">'
+    "<ResumptionToken>ABC123</ResumptionToken><IsFinished>false</IsFinished>"
+    '<ResultXml><rowset xmlns="urn:schemas-microsoft-com:xml-analysis:rowset">'
+    '<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:saw-sql="urn:saw-sql">'
+    '<xsd:complexType name="Row"><xsd:sequence>'
+    '<xsd:element name="Column0" type="xsd:int" saw-sql:columnHeading="0"/>'
+    '<xsd:element name="Column1" type="xsd:string" saw-sql:columnHeading="962 - Local Param 02"/>'
+    '<xsd:element name="Column2" type="xsd:string" saw-sql:columnHeading="MMS Id"/>'
+    "</xsd:sequence></xsd:complexType></xsd:schema>"
+    "<Row><Column0>0</Column0><Column1>$$a rams $$b x &amp; y $$d 1 </Column1>"
+    "<Column2>991</Column2></Row>"
+    "<Row><Column0>0</Column0><Column1/><Column2>992</Column2></Row>"
+    "</rowset></ResultXml></QueryResult>"
+)
+
+
+@mock.patch(
+    "catstats.management.commands.refresh_analytics_data.Alma_Api_Client",
+)
+class LoadRunTestCase(TestCase):
+    def test_progress_is_recorded(self, mock_client):
+        last_page = REPORT_PAGE_XML.replace(
+            "<IsFinished>false</IsFinished>", "<IsFinished>true</IsFinished>"
+        )
+        mock_client.return_value.get_analytics_report.return_value = {
+            "anies": [last_page]
+        }
+        call_command("refresh_analytics_data", yyyymm="202401", skip_warm_up=True)
+        run = LoadRun.objects.get()
+        self.assertEqual(run.yyyymm, "202401")
+        self.assertEqual(run.status, LoadRun.Status.DONE)
+        # The second row has no 962 fields, so isn't loaded.
+        self.assertEqual(
+            (run.pages_fetched, run.rows_fetched, run.rows_loaded), (1, 2, 1)
+        )
+        self.assertGreater(run.db_seconds, 0)
+        self.assertIsNotNone(run.finished_at)
+        response = self.client.get("/load_runs")
+        self.assertContains(response, "<td>202401</td>", html=True)
+
+    def test_rebuild_failure_is_recorded(self, mock_client):
+        mock_client.return_value.get_analytics_report.return_value = {
+            "anies": [
+                REPORT_PAGE_XML.replace(
+                    "<IsFinished>false</IsFinished>", "<IsFinished>true</IsFinished>"
+                )
+            ]
+        }
+        module = "catstats.management.commands.refresh_analytics_data"
+        for function in ["rebuild_rollups", "bump_data_version"]:
+            with self.subTest(function=function):
+                with mock.patch(
+                    f"{module}.{function}", side_effect=RuntimeError("Disk full")
+                ), self.assertRaises(RuntimeError):
+                    call_command(
+                        "refresh_analytics_data", yyyymm="202401", skip_warm_up=True
+                    )
+                run = LoadRun.objects.latest("id")
+                self.assertEqual(run.status, LoadRun.Status.FAILED)
+                self.assertEqual(run.error, "Disk full")
+                self.assertIsNotNone(run.finished_at)
+
+    def test_run_is_linked_to_its_job(self, mock_client):
+        mock_client.return_value.get_analytics_report.return_value = {
+            "anies": [
+                REPORT_PAGE_XML.replace(
+                    "<IsFinished>false</IsFinished>", "<IsFinished>true</IsFinished>"
+                )
+            ]
+        }
+        job, _ = enqueue_load("202401")
+        call_command(
+            "refresh_analytics_data",
+            yyyymm="202401",
+            load_job=job.id,
+            skip_warm_up=True,
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.load_run, LoadRun.objects.get())
+
+    def test_failure_is_recorded(self, mock_client):
+        mock_client.return_value.get_analytics_report.side_effect = ValueError(
+            "Analytics is down"
+        )
+        with self.assertRaises(ValueError):
+            call_command("refresh_analytics_data", yyyymm="202401", skip_warm_up=True)
+        run = LoadRun.objects.get()
+        self.assertEqual(run.status, LoadRun.Status.FAILED)
+        self.assertEqual(run.error, "Analytics is down")
+
+
+class RollupRebuildTestCase(TestCase):
+    def get_rollup_counts(self):
+        return {
+            model.__name__: dict(
+                model.objects.values_list("yyyymm")
+                .annotate(total=Sum("count"))
+                .order_by()
+            )
+            for model in [Field962Rollup, SubfieldRollup]
+        }
+
+    def test_only_given_months_are_rebuilt(self):
+        add_data_to_db(
+            [
+                get_analytics_row("991", "$$a rams $$c 20240115 $$h pcc"),
+                get_analytics_row("992", "$$a rams $$c 20231201 $$h pcc"),
+            ]
+        )
+        rebuild_rollups()
+        add_data_to_db(
+            [get_analytics_row("991", "$$a rams $$c 20240115 $$h pcc; $$c 20240201")]
+        )
+        # Left out of the rebuild, so still in the rollups
+        Field962.objects.filter(yyyymm="202312").delete()
+        rebuild_rollups(["202401", "202402"])
+        self.assertEqual(
+            self.get_rollup_counts(),
+            {
+                "Field962Rollup": {"202312": 1, "202401": 1, "202402": 1},
+                "SubfieldRollup": {"202312": 1, "202401": 1},
+            },
+        )
+
+    def test_unbuilt_rollups_are_built_for_all_months(self):
+        add_data_to_db(
+            [
+                get_analytics_row("991", "$$a rams $$c 20240115"),
+                get_analytics_row("992", "$$a rams $$c 20231201"),
+            ]
+        )
+        rebuild_rollups(["202401"])
+        self.assertEqual(
+            self.get_rollup_counts()["Field962Rollup"], {"202312": 1, "202401": 1}
+        )
+
+    def refresh(self, yyyymm, rows):
+        with mock.patch(
+            "catstats.management.commands.refresh_analytics_data.run_report",
+            side_effect=rows,
+        ):
+            call_command("refresh_analytics_data", yyyymm=yyyymm, skip_warm_up=True)
+
+    @mock.patch("catstats.management.commands.refresh_analytics_data.rebuild_rollups")
+    def test_months_of_loaded_and_replaced_fields_are_rebuilt(
+        self, mock_rebuild_rollups
+    ):
+        add_data_to_db([get_analytics_row("991", "$$a rams $$c 20231201")])
+        self.refresh("202401", [[get_analytics_row("991", "$$a rams $$c 20240115")]])
+        mock_rebuild_rollups.assert_called_once_with(["202312", "202401"])
+
+    @mock.patch("catstats.management.commands.refresh_analytics_data.rebuild_rollups")
+    @mock.patch(
+        "catstats.management.commands.refresh_analytics_data.get_incremental_months",
+        return_value=["202401"],
+    )
+    def test_unchanged_months_are_not_rebuilt(
+        self, mock_get_incremental_months, mock_rebuild_rollups
+    ):
+        rows = [get_analytics_row("991", "$$a rams $$c 20240115")]
+        self.refresh("INCREMENTAL", [rows])
+        self.refresh("INCREMENTAL", [rows])
+        mock_rebuild_rollups.assert_called_once_with(["202401"])
+
+    @mock.patch("catstats.management.commands.refresh_analytics_data.rebuild_rollups")
+    def test_rollups_are_not_rebuilt_after_errors(self, mock_rebuild_rollups):
+        with self.assertRaises(ConnectionError):
+            self.refresh("202401", ConnectionError("Analytics unavailable"))
+        mock_rebuild_rollups.assert_not_called()
+
+
+class AnalyticsServerTestCase(TestCase):
+    def start_server(self, **options):
+        # Returns the base URL of a stand-in server on any free port.
+        server = make_server(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    def test_month_is_loaded_from_server(self):
+        base_url = self.start_server(rows_per_month=1200, max_fields=1)
+        with mock.patch.dict(os.environ, {"ALMA_API_BASE_URL": base_url}):
+            call_command("refresh_analytics_data", yyyymm="202401", skip_warm_up=True)
+        run = LoadRun.objects.get()
+        self.assertEqual(run.status, LoadRun.Status.DONE)
+        # Pages of up to 1000 rows, as requested by run_report()
+        self.assertEqual((run.pages_fetched, run.rows_fetched), (2, 1200))
+        self.assertEqual(BibRecord.objects.count(), 1200)
+        self.assertEqual(
+            set(Field962.objects.values_list("yyyymm", flat=True)), {"202401"}
+        )
+
+    def test_pages(self):
+        alma = Alma_Api_Client(None, base_url=self.start_server(rows_per_month=30))
+        parameters = {"limit": 25, "col_names": "true"}
+        first_page = get_report_data(
+            alma.get_analytics_report(
+                parameters | {"path": "/x", "filter": "%$$c 202401%"}
+            )
+        )
+        self.assertEqual(first_page["is_finished"], "false")
+        self.assertEqual(len(first_page["rows"]), 25)
+        self.assertEqual(first_page["column_names"]["Column3"], "MMS Id")
+        token = first_page["resumption_token"]
+        last_page = get_report_data(
+            alma.get_analytics_report(parameters | {"token": token})
+        )
+        self.assertEqual(last_page["is_finished"], "true")
+        self.assertEqual(len(last_page["rows"]), 5)
+        self.assertEqual(last_page["column_names"], {})
+        # Finished reports can't be fetched again.
+        report = alma.get_analytics_report(parameters | {"token": token})
+        self.assertEqual(report["api_response"]["status_code"], 400)
+
+    def test_injected_errors(self):
+        base_url = self.start_server(error_rate=1, error_status=500)
+        alma = Alma_Api_Client(None, max_retries=0, base_url=base_url)
+        report = alma.get_analytics_report({"path": "/x"})
+        self.assertEqual(report["api_response"]["status_code"], 500)
+        self.assertTrue(report["errorsExist"])
+
+
+class ScriptedRequestHandler(BaseHTTPRequestHandler):
+    # Responds with the server's statuses in turn, then 200,
+    # recording each request's method.
+    def respond(self):
+        self.server.methods.append(self.command)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps({"status": status}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AlmaApiClientTestCase(TestCase):
+    def get_client(self, *statuses, **options):
+        # Returns a client of a server responding with statuses, then 200.
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedRequestHandler)
+        server.daemon_threads = True
+        server.statuses = list(statuses)
+        server.methods = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        return Alma_Api_Client(
+            None,
+            backoff_factor=0,
+            base_url=f"http://127.0.0.1:{server.server_port}",
+            **options,
+        )
+
+    def test_get_is_retried(self):
+        alma = self.get_client(429, 503)
+        response = alma.get_jobs()
+        self.assertEqual(response["api_response"]["status_code"], 200)
+        self.assertEqual(self.server.methods, ["GET", "GET", "GET"])
+
+    def test_get_fails_when_retries_run_out(self):
+        alma = self.get_client(503, 503, 503, max_retries=1)
+        response = alma.get_jobs()
+        self.assertEqual(response["api_response"]["status_code"], 503)
+        self.assertEqual(self.server.methods, ["GET", "GET"])
+
+    def test_post_is_not_retried(self):
+        alma = self.get_client(503)
+        response = alma.run_job("123")
+        self.assertEqual(response["api_response"]["status_code"], 503)
+        self.assertEqual(self.server.methods, ["POST"])
+
+    def test_timeout_is_passed_to_requests(self):
+        alma = self.get_client(timeout=(3, 30))
+        send = HTTPAdapter.send
+        with mock.patch.object(
+            HTTPAdapter, "send", autospec=True, side_effect=send
+        ) as mock_send:
+            alma.get_jobs()
+            alma.run_job("123")
+        self.assertEqual(
+            [call.kwargs["timeout"] for call in mock_send.call_args_list],
+            [(3, 30), (3, 30)],
+        )
+
+
+class ParseFieldsTestCase(TestCase):
+    def test_fields_are_parsed(self):
+        fields = parse_962_fields(
+            "$$a rams $$b abc $$c 20240115 $$d 1 $$k proj1 $$k proj 2; "
+            "$$a cmc $$a other $$g m1 $$h pcc $$z unused $$c 20240201"
+        )
+        self.assertEqual(
+            fields,
+            [
+                Field962Data(
+                    "rams", "abc", "20240115", "1", "", (), (), (), ("proj1", "proj 2")
+                ),
+                Field962Data("cmc", "", "20240201", "", "m1", ("pcc",), (), (), ()),
+            ],
+        )
+
+    def test_subfields_without_values(self):
+        for value in ["$$a rams $$b", "$$a rams $$  $$d 1", "$$arams"]:
+            with self.assertRaises(ValueError):
+                parse_962_fields(value)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_962_parser", bibs=10, repeat=1, stdout=out)
+        self.assertIn("parse_962_fields", out.getvalue())
+
+
+class LiveReportTestCase(TestCase):
+    def test_fields_are_filtered_and_counted(self):
+        filters = {
+            "cat_center": "rams",
+            "cataloger": "",
+            "year": "2024",
+            "month": "01",
+            "f962_k_code": "",
+            "language_code": "eng",
+        }
+        rows = [
+            {
+                "Local Param 02": "$$a rams $$c 20240115 $$d 1; $$a rams $$c 20240215 $$d 2",
+                "Language Code": "eng",
+                "Resource Type": "Book",
+            },
+            {
+                "Local Param 02": "$$a rams $$c 20240116 $$d 2",
+                "Language Code": "spa",
+                "Resource Type": "Book",
+            },
+            {
+                "Local Param 02": "$$a cmc $$c 20240117 $$d 1",
+                "Language Code": "eng",
+                "Resource Type": "Book",
+            },
+            {
+                "Local Param 02": "$$a rams $$c 20240118 $$d 1",
+                "Language Code": "eng",
+                "Resource Type": "Score",
+            },
+        ]
+        data = list(expand_and_filter_data(iter(rows), filters))
+        self.assertEqual([row["F962"].date for row in data], ["20240115", "20240118"])
+        # Bib values are shared, not copied.
+        self.assertIs(data[0].maps[1], rows[0])
+        self.assertEqual(
+            get_live_crosstab_data(iter(data), ["1", "2"]),
+            (
+                ["Format", "1", "Total"],
+                [["Book", 1, 1], ["Score", 1, 1], ["Totals", 2, 2]],
+            ),
+        )
+
+
+class ParseReportXmlTestCase(TestCase):
+    def test_page_is_parsed(self):
+        report_data = parse_report_xml(REPORT_PAGE_XML)
+        self.assertEqual(report_data["is_finished"], "false")
+        self.assertEqual(report_data["resumption_token"], "ABC123")
+        self.assertEqual(
+            report_data["column_names"],
+            {"Column0": "0", "Column1": "962 - Local Param 02", "Column2": "MMS Id"},
+        )
+        self.assertEqual(
+            report_data["rows"],
+            [
+                {
+                    "Column0": "0",
+                    "Column1": "$$a rams $$b x & y $$d 1",
+                    "Column2": "991",
+                },
+                {"Column0": "0", "Column1": None, "Column2": "992"},
+            ],
+        )
+
+    def test_page_without_rows(self):
+        report_data = parse_report_xml(
+            "<QueryResult><IsFinished>true</IsFinished>"
+            "<ResultXml><rowset></rowset></ResultXml></QueryResult>"
+        )
+        self.assertEqual(report_data["rows"], [])
+        self.assertEqual(report_data["column_names"], {})
+        self.assertIsNone(report_data["resumption_token"])
+
+
+class IncrementalRefreshTestCase(TestCase):
+    def test_get_months(self):
+        self.assertEqual(
+            get_months("202311", "202402"), ["202311", "202312", "202401", "202402"]
+        )
+
+    @mock.patch("catstats.management.commands.refresh_analytics_data.dt")
+    def test_incremental_months(self, mock_dt):
+        mock_dt.now.return_value = datetime(2024, 5, 15)
+        LoadState.objects.create(yyyymm="202402", status=LoadState.Status.LOADED)
+        LoadState.objects.create(yyyymm="202205", status=LoadState.Status.FAILED)
+        LoadState.objects.create(yyyymm="202201", status=LoadState.Status.LOADED)
+        self.assertEqual(
+            get_incremental_months(recent_months=2),
+            ["202405", "202404", "202403", "202402", "202205"],
+        )
+
+    def test_unchanged_month_is_not_reloaded(self):
+        rows = [
+            get_analytics_row("991", "$$a rams $$c 20240115 $$d 1"),
+            get_analytics_row("992", "$$a rams $$c 20240116 $$d 2"),
+        ]
+        with mock.patch(
+            "catstats.management.commands.refresh_analytics_data.run_report",
+            # Same rows in a different order the second time
+            side_effect=[rows, rows[::-1]],
+        ), mock.patch(
+            "catstats.management.commands.refresh_analytics_data.add_data_to_db"
+        ) as mock_add_data_to_db:
+            self.assertTrue(refresh_month("202401", only_if_changed=True))
+            self.assertFalse(refresh_month("202401", only_if_changed=True))
+        self.assertEqual(mock_add_data_to_db.call_count, 1)
+        state = LoadState.objects.get(yyyymm="202401")
+        self.assertEqual(state.status, LoadState.Status.LOADED)
+        self.assertEqual(state.row_count, 2)
+
+    def test_failed_month_is_recorded(self):
+        with mock.patch(
+            "catstats.management.commands.refresh_analytics_data.run_report",
+            side_effect=ConnectionError("Analytics unavailable"),
+        ):
+            with self.assertRaises(ConnectionError):
+                refresh_month("202401")
+        state = LoadState.objects.get(yyyymm="202401")
+        self.assertEqual(state.status, LoadState.Status.FAILED)
+        self.assertEqual(state.error, "Analytics unavailable")
+
+    def test_total_failure_is_logged(self):
+        module = "catstats.management.commands.refresh_analytics_data"
+        with mock.patch(
+            f"{module}.get_incremental_months", return_value=["202401"]
+        ), mock.patch(
+            f"{module}.refresh_month",
+            side_effect=ConnectionError("Analytics unavailable"),
+        ) as mock_refresh_month:
+            with self.assertLogs(module, "ERROR") as logs:
+                refresh_incremental_data(recent_months=1)
+        self.assertEqual(mock_refresh_month.call_count, 3)
+        self.assertIn("Total failure for 202401", logs.output[-1])
+
+
+def get_report_form_data(report, **kwargs):
+    # POST data for the report form, with optional filters unset by default.
+    form_data = {
+        "report": report,
+        "cat_center": "ALL",
+        "year": "2024",
+        "month": "01",
+        "report_period": "fy",
+        "cataloger": "",
+        "language_code": "",
+        "place_code": "",
+        "f962_k_code": "",
+    }
+    return form_data | kwargs
+
+
+class ReportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        add_data_to_db(
+            [
+                get_analytics_row(
+                    "991",
+                    "$$a rams $$b abc $$c 20240115 $$d 1 $$h pcc $$i n1 $$k proj1;"
+                    " $$a rams $$b abc $$c 20240210 $$d 2rev $$g ill $$j s1",
+                ),
+                get_analytics_row(
+                    "992",
+                    "$$a eal $$b def $$c 20231120 $$d 2+ $$h pcc $$h lc $$i n2",
+                    resource_type="Score",
+                ),
+                get_analytics_row(
+                    "993", "$$a rams $$b ghi $$c 20230105 $$d 1 $$g ill $$k proj1"
+                ),
+            ]
+        )
+
+    def get_display_data(self, form_data):
+        response = self.client.post("/report", form_data)
+        self.assertEqual(response.status_code, 200)
+        return response.context["headers"], response.context["display_data"]
+
+    def test_report_01(self):
+        headers, display_data = self.get_display_data(get_report_form_data("01"))
+        self.assertEqual(headers, ["Format", "1", "2+", "Total"])
+        self.assertEqual(
+            display_data, [["Book", 1, 0, 1], ["Score", 0, 1, 1], ["Totals", 1, 1, 2]]
+        )
+
+    def test_rollups_match_raw_data(self):
+        filter_sets = [
+            {},
+            {"cat_center": "rams"},
+            {"report_period": "ym"},
+            {"report_period": "cy", "year": "2023"},
+            {"cataloger": "ABC"},
+            {"language_code": "eng", "place_code": "cau"},
+            {"place_code": "xxu"},
+        ]
+        for report, _ in REPORTS:
+            for filter_set in filter_sets:
+                form_data = get_report_form_data(report, **filter_set)
+                raw_results = self.get_display_data(form_data)
+                rebuild_rollups()
+                bump_data_version()
+                with self.subTest(report=report, **filter_set):
+                    self.assertEqual(self.get_display_data(form_data), raw_results)
+                Field962Rollup.objects.all().delete()
+                SubfieldRollup.objects.all().delete()
+                bump_data_version()
+
+    def test_project_filter(self):
+        rebuild_rollups()
+        headers, display_data = self.get_display_data(
+            get_report_form_data("01", f962_k_code="PROJ1")
+        )
+        self.assertEqual(display_data, [["Book", 1, 1], ["Totals", 1, 1]])
+
+    def test_project_filter_on_subfield_reports(self):
+        headers, display_data = self.get_display_data(
+            get_report_form_data("03", f962_k_code="proj1")
+        )
+        self.assertEqual(display_data, [["n1", 1], ["Totals", 1]])
+
+    def test_raw_queries_use_exists_and_joins(self):
+        # Project filter as EXISTS, and subfields joined directly to their
+        # field, rather than nested IN (SELECT ...) subqueries.
+        for report in ["01", "02", "03"]:
+            with self.subTest(report=report):
+                filters = get_report_filters(
+                    get_report_form_data(report, f962_k_code="proj1", cat_center="rams")
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    get_report(filters, use_rollups=False)
+                sql = queries[0]["sql"].upper()
+                self.assertEqual(sql.count("EXISTS("), 1)
+                self.assertNotIn(" IN (SELECT", sql)
+                if report != "01":
+                    self.assertIn('INNER JOIN "CATSTATS_FIELD962"', sql)
+
+    def test_every_report_has_a_spec(self):
+        self.assertEqual(sorted(REPORT_SPECS), [code for code, _ in REPORTS])
+
+    @mock.patch.dict(
+        REPORT_SPECS,
+        {"01": ReportSpec(SUBFIELDS, SUMMARY, "subfield_value", subfield_codes=["k"])},
+    )
+    def test_reports_not_in_rollups_use_raw_tables(self):
+        # 962 $k values aren't in the rollups.
+        rebuild_rollups()
+        filters = get_report_filters(get_report_form_data("01"))
+        self.assertEqual(get_report(filters)[1], [["proj1", 1], ["Totals", 1]])
+
+    def test_csv_export(self):
+        form_data = get_report_form_data("03") | {"export": "csv"}
+        response = self.client.post("/report", form_data)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="catstats_03_ALL_202307_202406.csv"',
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content).decode("utf-8"),
+            "Value,Count\r\nn1,1\r\nn2,1\r\ns1,1\r\nTotals,3\r\n",
+        )
+        # Timed, but left out of the summary
+        self.assertTrue(ReportTiming.objects.get().export)
+        self.assertEqual(get_timing_summary(timezone.now() - timedelta(days=1)), [])
+
+    def test_results_are_cached_until_data_changes(self):
+        form_data = get_report_form_data("05")
+        results = self.get_display_data(form_data)
+        with mock.patch("catstats.reports.get_report") as mock_get_report:
+            # Same report and fiscal year, from a different month
+            self.assertEqual(
+                self.get_display_data(form_data | {"month": "03"}),
+                results,
+            )
+            mock_get_report.assert_not_called()
+        bump_data_version()
+        with mock.patch(
+            "catstats.reports.get_report", return_value=([], [[]])
+        ) as mock_get_report:
+            self.get_display_data(form_data)
+            mock_get_report.assert_called_once()
+
+    def test_data_version_survives_cache_culling(self):
+        data_version = bump_data_version()
+        caches = {
+            "default": settings.CACHES["default"]
+            | {"OPTIONS": {"MAX_ENTRIES": 5, "CULL_FREQUENCY": 2}}
+        }
+        keys = [f"catstats:report:{data_version}:{number}" for number in range(20)]
+        with override_settings(CACHES=caches):
+            for key in keys:
+                cache.set(key, key)
+            # Some were culled.
+            self.assertLess(len(cache.get_many(keys)), len(keys))
+            self.assertEqual(get_data_version(), data_version)
+
+    def test_report_timings_are_recorded(self):
+        bump_data_version()
+        form_data = get_report_form_data("05")
+        self.get_display_data(form_data)
+        self.get_display_data(form_data)
+        computed, cached = ReportTiming.objects.order_by("id")
+        self.assertEqual(computed.report, "05")
+        self.assertFalse(computed.cached)
+        self.assertTrue(cached.cached)
+        self.assertGreater(computed.query_count, 0)
+        # Only the data version: cache lookups aren't counted.
+        self.assertEqual(cached.query_count, 1)
+        self.assertEqual(computed.row_count, cached.row_count)
+        self.assertGreater(computed.total_seconds, computed.db_seconds)
+        [summary] = get_timing_summary(timezone.now() - timedelta(days=1))
+        self.assertEqual((summary["requests"], summary["uncached"]), (2, 1))
+        self.assertEqual(summary["queries_p95"], computed.query_count)
+        response = self.client.get("/report_timings")
+        self.assertContains(response, "<td>05</td>", html=True)
+
+    def test_recent_requests_are_shown_outside_the_period(self):
+        timing = ReportTiming.objects.create(report="05", filters={})
+        ReportTiming.objects.filter(pk=timing.pk).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+        response = self.client.get("/report_timings?days=1")
+        self.assertContains(response, "No report requests have been recorded")
+        self.assertContains(response, "<td>05</td>", html=True)
+
+    def test_report_timings_days_are_limited(self):
+        response = self.client.get("/report_timings?days=1000000")
+        self.assertEqual(response.context["days"], 3650)
+
+    def test_percentile(self):
+        values = list(range(1, 21))
+        self.assertEqual(percentile(values, 50), 10)
+        self.assertEqual(percentile(values, 95), 19)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+    @mock.patch("catstats.reports.timezone")
+    def test_warm_up_caches_common_reports(self, mock_timezone):
+        mock_timezone.localdate.return_value = date(2024, 2, 20)
+        warm_report_cache()
+        with mock.patch("catstats.reports.get_report") as mock_get_report:
+            for report, _ in REPORTS:
+                for report_period in ["ym", "fy", "cy"]:
+                    self.get_display_data(
+                        get_report_form_data(
+                            report, month="02", report_period=report_period
+                        )
+                    )
+            mock_get_report.assert_not_called()
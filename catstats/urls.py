@@ -5,6 +5,9 @@ urlpatterns = [
     path("", views.run_report, name="run_report"),
     path("report", views.run_report, name="run_report"),
     path("load_data", views.load_data, name="load_data"),
+    path("load_status", views.load_status, name="load_status"),
+    path("load_runs", views.load_runs, name="load_runs"),
+    path("report_timings", views.report_timings, name="report_timings"),
     path("view_logs", views.view_logs, name="view_logs"),
     path("release_notes", views.release_notes, name="release_notes"),
 ]
@@ -1,5 +1,7 @@
 # Supporting functions for view(s)
-from collections import Counter
+import logging
+from copy import deepcopy
+from django.db.models import Count
 
 
 def get_calendar_year(yyyymm):
@@ -59,12 +61,67 @@ def get_difficulties(report_code):
     return difficulties
 
 
-def get_summary_data(list_of_data):
-    # Transform a list of scalar values into a list of lists,
-    # with each being [value, count].
-    # E.g., ['a', 'b', 'a'] becomes [['a', 2], ['b', 1]]
-    counts = Counter(list_of_data)
-    data_rows = sorted([[k, v] for k, v in counts.items()])
+def get_report_filters(cleaned_data):
+    # Normalize report form data, so equivalent requests get identical filters:
+    # user-entered filters are lower-cased, and year, month and report period
+    # are replaced by the range of yyyymm values they cover.
+    filters = deepcopy(cleaned_data)
+    # Lower-case specific user-entered filters for later comparison;
+    # no non-ASCII support required.
+    lcase_required = ["cataloger", "f962_k_code", "language_code", "place_code"]
+    for filter in lcase_required:
+        filters[filter] = filters[filter].lower()
+
+    yyyymm = filters.pop("year") + filters.pop("month")
+    report_period = filters.pop("report_period")
+    if report_period == "cy":
+        start_yyyymm, end_yyyymm = get_calendar_year(yyyymm)
+    elif report_period == "fy":
+        start_yyyymm, end_yyyymm = get_fiscal_year(yyyymm)
+    else:
+        # Use the same value for both
+        start_yyyymm, end_yyyymm = (yyyymm, yyyymm)
+    filters["start_yyyymm"] = start_yyyymm
+    filters["end_yyyymm"] = end_yyyymm
+    return filters
+
+
+def get_field_filters(filters, field_prefix="", bib_prefix=""):
+    # Keyword arguments for filtering 962 data on report filters (except 962 $k).
+    # Rollups have bib-level values directly; Field962 needs bib_prefix
+    # "bib_record__" to get them from its BibRecord, and RepeatableSubfield
+    # needs field_prefix for field-level values too.  All have yyyymm.
+    # Mandatory filter on year & month, but can be different ranges.
+    field_filters = {
+        "yyyymm__gte": filters["start_yyyymm"],
+        "yyyymm__lte": filters["end_yyyymm"],
+    }
+    if field_prefix:
+        # Same range on the joined field, so its partitions are pruned too.
+        field_filters[f"{field_prefix}yyyymm__gte"] = filters["start_yyyymm"]
+        field_filters[f"{field_prefix}yyyymm__lte"] = filters["end_yyyymm"]
+    # Mandatory filter, but ALL is a special case (no filtering if ALL is chosen)
+    if filters["cat_center"] != "ALL":
+        field_filters[f"{field_prefix}cat_center__exact"] = filters["cat_center"]
+    # Optional filters
+    if filters["cataloger"] != "":
+        field_filters[f"{field_prefix}cataloger__exact"] = filters["cataloger"]
+    for bib_filter in ["language_code", "place_code"]:
+        if filters[bib_filter] != "":
+            field_filters[f"{bib_prefix}{bib_filter}__exact"] = filters[bib_filter]
+    return field_filters
+
+
+def get_summary_data(report_data, field_name, count=None):
+    # Group report_data (a queryset) on field_name in the database,
+    # returning a list of lists with each being [value, count].
+    # E.g., values 'a', 'b', 'a' become [['a', 2], ['b', 1]]
+    # count is the aggregate to use, by default counting records.
+    if count is None:
+        count = Count("id")
+    counts = report_data.values_list(field_name).annotate(count=count)
+    # Sort here, not in the database, to keep Python (not collation) ordering.
+    data_rows = sorted([[k, v] for k, v in counts.order_by()])
     data_rows.append(get_total_row(data_rows))
     return data_rows
 
@@ -84,30 +141,22 @@ def get_total_row(data_rows):
 def get_crosstab_data(report_data, row_name, col_name):
     # Generic function returning crosstab (list of lists)
     # on row_name and col_name, with counts and totals.
+    # report_data is a grouped queryset (values().annotate(count=...)),
+    # evaluated once and pivoted here rather than queried per cell.
+    counts = {}
+    for row in report_data:
+        key = (row[row_name], row[col_name])
+        counts[key] = counts.get(key, 0) + row["count"]
+
     # Data rows for crosstab
-    rows = sorted(set([row[row_name] for row in report_data]))
+    rows = sorted(set([row for row, _ in counts]))
     # Data columns for crosstab
-    cols = sorted(set([row[col_name] for row in report_data]))
-
-    # For passing variable field names into filter below.
-    row_name__exact = row_name + "__exact"
-    col_name__exact = col_name + "__exact"
+    cols = sorted(set([col for _, col in counts]))
 
     data_rows = []
     for row in rows:
-        data_row = [row]
-        row_total = 0
-        for col in cols:
-            count = report_data.filter(
-                **{row_name__exact: row, col_name__exact: col}
-            ).values_list("count", flat=True)
-            if len(count) == 0:
-                val = 0
-            else:
-                val = count[0]
-            data_row.append(val)
-            row_total += val
-        data_row.append(row_total)
+        data_row = [row] + [counts.get((row, col), 0) for col in cols]
+        data_row.append(sum(data_row[1:]))
         data_rows.append(data_row)
 
     # Data for template is list of lists
@@ -115,3 +164,53 @@ def get_crosstab_data(report_data, row_name, col_name):
     data_rows.append(get_total_row(data_rows))
     # Return column_headers separately to make formatting easier in template.
     return column_headers, data_rows
+
+
+def read_log_chunk(log_file, end=None, size=65536, start=None):
+    # Read up to size bytes of log_file, starting at byte offset start, or else
+    # ending at byte offset end (default: end of file), seeking instead of
+    # reading the whole file.
+    # Returns whole lines only, with the offsets actually read and the file size,
+    # so the next chunk either way starts at the returned start or end.
+    with open(log_file, "rb") as f:
+        file_size = f.seek(0, 2)
+        if start is not None:
+            start = max(0, min(start, file_size))
+            end = min(start + size, file_size)
+        else:
+            end = file_size if end is None else max(0, min(end, file_size))
+            start = max(0, end - size)
+        at_line_start = start == 0
+        if not at_line_start:
+            f.seek(start - 1)
+            at_line_start = f.read(1) == b"\n"
+        f.seek(start)
+        chunk = f.read(end - start)
+    if not at_line_start:
+        # Skip the partial first line, unless it's all there is.
+        newline = chunk.find(b"\n")
+        if newline != -1:
+            start += newline + 1
+            chunk = chunk[newline + 1 :]
+    if end < file_size and not chunk.endswith(b"\n"):
+        # Likewise the partial last line, which the next chunk will have.
+        newline = chunk.rfind(b"\n")
+        if newline != -1:
+            end -= len(chunk) - newline - 1
+            chunk = chunk[: newline + 1]
+    lines = chunk.decode("utf-8", errors="replace").splitlines()
+    return lines, start, end, file_size
+
+
+def filter_log_lines(lines, level="", keyword=""):
+    # Yield lines at or above level (a logging level name), containing keyword
+    # (ignoring case).  Lines not starting with a level name, like tracebacks,
+    # go with the message before them.
+    levels = logging.getLevelNamesMapping()
+    min_level = levels.get(level, logging.NOTSET)
+    keyword = keyword.lower()
+    line_level = logging.NOTSET
+    for line in lines:
+        line_level = levels.get(line.split(" ", 1)[0], line_level)
+        if line_level >= min_level and keyword in line.lower():
+            yield line
@@ -1,166 +1,165 @@
-import asyncio
+import csv
 import logging
-from copy import deepcopy
-from django.db.models import Count, F
-from django.http import HttpRequest, HttpResponse
+from datetime import timedelta
+from django.db import connection
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import escape
 from .forms import CatStatsForm
-from .models import Field962, RepeatableSubfield
-from catstats.view_utils import (
-    get_crosstab_data,
-    get_difficulties,
-    get_summary_data,
-    get_calendar_year,
-    get_fiscal_year,
-)
+from catstats.jobs import enqueue_load, is_valid_yyyymm
+from catstats.models import LoadJob, LoadRun, ReportTiming
+from catstats.reports import ReportTimer, get_cached_report, get_timing_summary
+from catstats.view_utils import filter_log_lines, get_report_filters, read_log_chunk
 
 logger = logging.getLogger(__name__)
 
+LOG_FILE = "logs/application.log"
+# Largest page of the log file shown at once
+MAX_LOG_PAGE_KB = 1024
+# Placeholder in the log page for the (streamed) log lines
+LOG_LINES_MARKER = "@@log-lines@@"
+# Longest period of report timings shown: about 10 years
+MAX_TIMING_DAYS = 3650
+
 
 def run_report(request: HttpRequest) -> HttpResponse:
     if request.method == "POST":
         form = CatStatsForm(request.POST)
         if form.is_valid():
-            # For brevity and convenience.
-            filters = deepcopy(form.cleaned_data)
-            # Lower-case specific user-entered filters for later comparison;
-            # no non-ASCII support required.
-            lcase_required = ["cataloger", "f962_k_code", "language_code", "place_code"]
-            for filter in lcase_required:
-                filters[filter] = filters[filter].lower()
+            # Normalized, so equivalent requests share cached results.
+            filters = get_report_filters(form.cleaned_data)
             logger.info(f"{filters = }")
+            # Queries, and time spent, are recorded in a ReportTiming.
+            timer = ReportTimer(filters)
+            with connection.execute_wrapper(timer):
+                with timer.timed("report"):
+                    headers, display_data = get_cached_report(filters, timer)
+                with timer.timed("render"):
+                    if request.POST.get("export") == "csv":
+                        timer.timing.export = True
+                        response = export_csv(filters, headers, display_data)
+                    else:
+                        response = render(
+                            request,
+                            "catstats/catstats.html",
+                            {
+                                "form": form,
+                                "headers": headers,
+                                "display_data": display_data,
+                            },
+                        )
+            timer.finish(len(display_data))
+            return response
 
-            # Always apply form filters to data.
-            # Mandatory filter on year & month, but can be different ranges.
-            yyyymm = filters["year"] + filters["month"]
-            report_period = filters["report_period"]
-            if report_period == "cy":
-                start_yyyymm, end_yyyymm = get_calendar_year(yyyymm)
-            elif report_period == "fy":
-                start_yyyymm, end_yyyymm = get_fiscal_year(yyyymm)
-            else:
-                # Use the same value for both
-                start_yyyymm, end_yyyymm = (yyyymm, yyyymm)
-            report_data = Field962.objects.filter(
-                yyyymm__gte=start_yyyymm, yyyymm__lte=end_yyyymm
-            )
-            # Mandatory filter, but ALL is a special case (no filtering if ALL is chosen)
-            if filters["cat_center"] != "ALL":
-                report_data = report_data.filter(
-                    cat_center__exact=filters["cat_center"]
-                )
-            # Optional filters
-            if filters["cataloger"] != "":
-                report_data = report_data.filter(cataloger__exact=filters["cataloger"])
-            if filters["language_code"] != "":
-                report_data = report_data.filter(
-                    bib_record__language_code__exact=filters["language_code"]
-                )
-            if filters["place_code"] != "":
-                report_data = report_data.filter(
-                    bib_record__place_code__exact=filters["place_code"]
-                )
-            # Project requires special handling as 962 $k is repeatable
-            if filters["f962_k_code"] != "":
-                report_data = report_data.filter(
-                    id__in=RepeatableSubfield.objects.filter(
-                        subfield_code__exact="k",
-                        subfield_value__exact=filters["f962_k_code"],
-                    ).values("field_962")
-                )
-
-            report_code = filters["report"]
-            # List of difficulty values, needed for several reports
-            difficulties = get_difficulties(report_code)
-
-            # Each report gets different filters and either crosstab or summary layout
-            if report_code == "01":
-                # New titles by format & difficulty
-                # Filter on difficulties
-                report_data = report_data.filter(difficulty__in=difficulties)
-                # Get just the relevant data: List of dicts with difficulty, resource_type, count
-                report_data = report_data.values(
-                    "difficulty", format=F("bib_record__resource_type")
-                ).annotate(count=Count("id"))
-                headers, display_data = get_crosstab_data(
-                    report_data, "format", "difficulty"
-                )
-            elif report_code == "02":
-                # National contributions by format
-                # Join subfield records with field-level report data
-                recs_h = RepeatableSubfield.objects.filter(
-                    subfield_code__exact="h", field_962__in=report_data
-                ).select_related("field_962__bib_record")
-                # Get just the relevant data: List of dicts with national_info, resource_type, count
-                recs_h = recs_h.values(
-                    national_info=F("subfield_value"),
-                    format=F("field_962__bib_record__resource_type"),
-                ).annotate(count=Count("id"))
-                headers, display_data = get_crosstab_data(
-                    recs_h, "format", "national_info"
-                )
-            elif report_code == "03":
-                # Authority contributions
-                all_vals = RepeatableSubfield.objects.filter(
-                    subfield_code__in=["i", "j"], field_962__in=report_data
-                ).values_list("subfield_value", flat=True)
-                # Generic headers
-                headers = ["Value", "Count"]
-                display_data = get_summary_data(all_vals)
-            elif report_code == "04":
-                # Maintenance by format & difficulty
-                # Filter on difficulties
-                report_data = report_data.filter(difficulty__in=difficulties)
-                # Get just the relevant data: List of dicts with difficulty, resource_type, count
-                report_data = report_data.values(
-                    "difficulty", format=F("bib_record__resource_type")
-                ).annotate(count=Count("id"))
-                headers, display_data = get_crosstab_data(
-                    report_data, "format", "difficulty"
-                )
-            elif report_code == "05":
-                # Maintenance (broad)
-                # Filter on difficulties
-                all_vals = report_data.filter(difficulty__in=difficulties).values_list(
-                    "difficulty", flat=True
-                )
-                # Generic headers
-                headers = ["Value", "Count"]
-                display_data = get_summary_data(all_vals)
-            elif report_code == "06":
-                # Maintenance (details)
-                all_vals = report_data.filter(maint_info__gt="").values_list(
-                    "maint_info", flat=True
-                )
-                # Generic headers
-                headers = ["Value", "Count"]
-                display_data = get_summary_data(all_vals)
-
-        return render(
-            request,
-            "catstats/catstats.html",
-            {
-                "form": form,
-                "headers": headers,
-                "display_data": display_data,
-            },
-        )
+        return render(request, "catstats/catstats.html", {"form": form})
     else:
         form = CatStatsForm()
         report_data = []
         return render(request, "catstats/catstats.html", {"form": form})
 
 
+class Echo:
+    # Pseudo-buffer for csv.writer, returning each row instead of storing it,
+    # so rows can be streamed.
+    def write(self, value):
+        return value
+
+
+def export_csv(filters, headers, display_data) -> StreamingHttpResponse:
+    # Report rows as a CSV download, streamed row by row, with the same
+    # (possibly cached) data as the HTML page.
+    writer = csv.writer(Echo())
+    filename = (
+        f"catstats_{filters['report']}_{filters['cat_center']}"
+        f"_{filters['start_yyyymm']}_{filters['end_yyyymm']}.csv"
+    )
+    return StreamingHttpResponse(
+        (writer.writerow(row) for row in [headers, *display_data]),
+        content_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 def view_logs(request: HttpRequest) -> HttpResponse:
-    # QAD way to view log file in deployed environment
-    log_file = "logs/application.log"
+    # QAD way to view log file in deployed environment.
+    # Shows one page (kb KB) at a time, starting at byte offset start, or
+    # ending at byte offset end (default: end of file), so the whole file is
+    # never read; filtered lines are streamed into the page.
+    log_file = LOG_FILE
+    level = request.GET.get("level", "")
+    keyword = request.GET.get("q", "")
+    kb = request.GET.get("kb", "")
+    kb = min(int(kb), MAX_LOG_PAGE_KB) if kb.isdigit() and int(kb) > 0 else 64
+    # Pages start at start (paging forward), or end at end (default: end of file).
+    start = request.GET.get("start", "")
+    start = int(start) if start.isdigit() else None
+    end = request.GET.get("end", "")
+    end = int(end) if end.isdigit() else None
+    context = {
+        "levels": ["", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        "level": level,
+        "keyword": keyword,
+        "kb": kb,
+        "max_kb": MAX_LOG_PAGE_KB,
+        "log_lines_marker": LOG_LINES_MARKER,
+    }
     try:
-        with open(log_file, "r") as f:
-            log_data = f.read()
+        lines, start, end, file_size = read_log_chunk(log_file, end, kb * 1024, start)
     except FileNotFoundError:
-        log_data = f"Log file {log_file} not found"
+        context["log_error"] = f"Log file {log_file} not found"
+        return render(request, "catstats/logs.html", context)
+
+    # Paging links keep the current filters.
+    query = request.GET.copy()
+    query.pop("start", None)
+    query["end"] = start
+    context["older_query"] = query.urlencode()
+    query.pop("end")
+    query["start"] = end
+    context["newer_query"] = query.urlencode()
+    query.pop("start")
+    context["latest_query"] = query.urlencode()
+    context.update(start=start, end=end, file_size=file_size)
+    # The marker's last occurrence, in case it's in the filters too
+    page_start, _, page_end = render_to_string(
+        "catstats/logs.html", context, request
+    ).rpartition(LOG_LINES_MARKER)
 
-    return render(request, "catstats/logs.html", {"log_data": log_data})
+    def stream_page():
+        yield page_start
+        for line in filter_log_lines(lines, level, keyword):
+            yield escape(line) + "\n"
+        yield page_end
+
+    return StreamingHttpResponse(stream_page())
+
+
+def load_runs(request: HttpRequest) -> HttpResponse:
+    # Progress and timings of recent data loads
+    runs = LoadRun.objects.order_by("-started_at", "-id")[:50]
+    return render(request, "catstats/load_runs.html", {"load_runs": runs})
+
+
+def report_timings(request: HttpRequest) -> HttpResponse:
+    # Median and 95th percentile report timings over the last days days,
+    # and the most recent requests
+    days = request.GET.get("days", "")
+    days = min(int(days), MAX_TIMING_DAYS) if days.isdigit() and int(days) > 0 else 30
+    since = timezone.now() - timedelta(days=days)
+    context = {
+        "days": days,
+        "summary": get_timing_summary(since),
+        "timings": ReportTiming.objects.order_by("-created_at", "-id")[:50],
+    }
+    return render(request, "catstats/report_timings.html", context)
 
 
 def release_notes(request: HttpRequest) -> HttpResponse:
@@ -168,10 +167,42 @@ def release_notes(request: HttpRequest) -> HttpResponse:
     return render(request, "catstats/release_notes.html")
 
 
-async def load_data(request: HttpRequest) -> HttpResponse:
-    # QAD way to run management command asynchronously
+def load_data(request: HttpRequest) -> HttpResponse:
+    # Queue a data load, run in the background by the run_load_worker command.
     yyyymm = request.GET["yyyymm"]
-    cmd = f"python manage.py refresh_analytics_data -m {yyyymm}"
-    # No need for return value
-    _ = await asyncio.create_subprocess_shell(cmd)
-    return HttpResponse(f"Loading data for {yyyymm} - see log for results")
+    if not is_valid_yyyymm(yyyymm):
+        return HttpResponseBadRequest(f"Invalid yyyymm: {yyyymm}")
+    job, created = enqueue_load(yyyymm)
+    if created:
+        message = f"Queued data load for {yyyymm}"
+    else:
+        message = f"Data for {yyyymm} is already {job.status}"
+    return HttpResponse(f"{message} - see load_status?id={job.id} for results")
+
+
+def load_status(request: HttpRequest) -> HttpResponse:
+    # Status of one load job, or the most recent ones.
+    jobs = LoadJob.objects.order_by("-created_at", "-id")
+    if "id" in request.GET:
+        if not request.GET["id"].isdigit():
+            return HttpResponseBadRequest(f"Invalid id: {request.GET['id']}")
+        jobs = jobs.filter(id=request.GET["id"])
+    job_data = [
+        {
+            "id": job.id,
+            "yyyymm": job.yyyymm,
+            "status": job.status,
+            "rows_loaded": job.rows_loaded,
+            "load_run": job.load_run_id,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "hostname": job.hostname,
+            "pid": job.pid,
+            "heartbeat_at": job.heartbeat_at,
+            "duration": job.duration,
+        }
+        for job in jobs[:20]
+    ]
+    return JsonResponse({"jobs": job_data})
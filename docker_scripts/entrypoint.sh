@@ -19,6 +19,9 @@ done
 # Run database migrations
 python manage.py migrate
 
+# Create database cache table, if it doesn't exist yet
+python manage.py createcachetable
+
 if [ "$DJANGO_RUN_ENV" = "dev" ]; then
   # Create default superuser for dev environment, using django env vars.
   # Logs will show error if this exists, which is OK.
@@ -95,6 +95,23 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Database cache, shared by all application processes and the
+# refresh_analytics_data command; table is created by `manage.py createcachetable`.
+# Report results are also invalidated whenever data is refreshed.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "catstats_cache",
+        # 8 days, as data is refreshed weekly
+        "TIMEOUT": 60 * 60 * 24 * 8,
+        "OPTIONS": {
+            "MAX_ENTRIES": 5000,
+        },
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 